@@ -0,0 +1,106 @@
+"""Cold-start benchmark for the fashion agent entry point.
+
+Imports each project module in a fresh interpreter with `python -X importtime`
+and reports its wall-clock import time plus the most expensive dependencies
+it pulls in. Nothing here needs an API key: importing a module must not build
+clients or touch the network.
+
+Usage:
+    python benchmarks/bench_cold_start.py [--repeat 5] [--top 10] [module ...]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+DEFAULT_MODULES = [
+    "main",
+    "anthropic_client",
+    "rate_limiter",
+    "product_catalog",
+    "dedup",
+    "snippet_ranker",
+    "fetch_and_extract_image",
+    "agent_conseiller",
+    "agent_product_sheet",
+    "price_searcher",
+    "user_interface",
+]
+
+
+def _run_import(module: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", f"import {module}"]
+    return subprocess.run(command, cwd=SRC_DIR, capture_output=True, text=True)
+
+
+def wall_time(module: str, repeat: int) -> float:
+    """Median wall-clock seconds to start an interpreter and import `module`."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = _run_import(module)
+        timings.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return statistics.median(timings)
+
+
+def import_breakdown(module: str):
+    """(cumulative_us, name) for every direct dependency imported by `module`."""
+    result = _run_import(module, importtime=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, int(cumulative_us), name.strip()))
+
+    # -X importtime prints children before their parent: walk back from the module's line
+    names = [name for depth, _, name in rows if depth == 0]
+    if module not in names:
+        return []
+    end = max(i for i, row in enumerate(rows) if row[0] == 0 and row[2] == module)
+    children = []
+    for depth, cumulative_us, name in reversed(rows[:end]):
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((cumulative_us, name))
+    return children
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    baseline = wall_time("sys", args.repeat)
+    print(f"Interpreter startup: {baseline * 1000:.0f} ms (subtracted below)\n")
+    print(f"{'module':<26}{'import ms':>10}")
+    print("-" * 36)
+
+    for module in args.modules:
+        try:
+            seconds = wall_time(module, args.repeat) - baseline
+        except RuntimeError as e:
+            print(f"{module:<26}{'failed':>10}  ({e})")
+            continue
+        print(f"{module:<26}{seconds * 1000:>10.0f}")
+
+        for cumulative_us, name in sorted(import_breakdown(module), reverse=True)[: args.top]:
+            print(f"    {name:<32}{cumulative_us / 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,24 @@ from smolagents import CodeAgent
 import requests
 from dotenv import load_dotenv
 import os
+import re
 import json
+
+from deadline import HTTP_TIMEOUT, current_deadline
+from model_tiers import get_tier
+from prompt_templates import mark_cached
+from rate_limiter import get_rate_limiter, estimate_tokens
+
 load_dotenv(dotenv_path="fashion_agent/.env")
 API_KEY = os.getenv("ANTHROPIC_API_KEY")
 url = "https://api.anthropic.com/v1/messages"
 
+# Hidden trailer where the model reports the criteria it knows so far
+SLOTS_PATTERN = re.compile(r"<slots>(.*?)</slots>", re.DOTALL)
+
 
 class AgentAdvisor(CodeAgent):
-    def __init__(self, model, api_key):
+    def __init__(self, model, api_key, on_partial_criteria=None):
         self.name = "AgentAdvisor"
         self.description = "An AI shopping advisor that helps users find clothing based on their preferences."
         self.api_key = API_KEY
@@ -31,8 +41,26 @@ class AgentAdvisor(CodeAgent):
             "budget (format [min, max]), preferred materials, preferred colors, brands, second-hand acceptable (true if yes). "
             "If the user's answer is not directly related to a criterion, give advice or ask clarifying questions. "
             "When you have collected all the answers, STOP asking questions and output ONLY a JSON object with these keys and the user's answers. "
-            "Do not explain or comment, just output the JSON object at the end."
+            "Do not explain or comment, just output the JSON object at the end. "
+            "Until then, end every reply with the criteria known so far as a JSON object inside "
+            '<slots></slots> tags, e.g. <slots>{"type": "dress", "style": "chic"}</slots>.'
+        )
+        # Called with the partially known criteria after each turn (e.g. to prefetch products)
+        self.on_partial_criteria = on_partial_criteria
+        # Raw JSON answer of the dialogue, updated by refine_criteria
+        self.raw_criteria = None
+
+    def _post_messages(self, data):
+        """POST to the Messages API, raising on 429/5xx so the rate limiter can retry."""
+        response = requests.post(
+            self.url,
+            headers=self.headers,
+            json=data,
+            timeout=current_deadline().timeout(HTTP_TIMEOUT),
         )
+        if response.status_code == 429 or response.status_code >= 500:
+            response.raise_for_status()
+        return response.json()
 
     def run_dialogue(self):
         history = [
@@ -52,35 +80,98 @@ class AgentAdvisor(CodeAgent):
                 continue
             history.append({"role": "user", "content": user_input})
 
-            messages = [{"role": "user", "content": self.system_prompt}] + history
+            # The system prompt is resent every turn: cache it as the shared prefix
+            messages = [{"role": "user", "content": mark_cached(self.system_prompt)}] + history
 
+            tier = get_tier("advisor")
             data = {
-                "model": "claude-3-haiku-20240307",
-                "max_tokens": 256,
+                "model": tier.model_id,
+                "max_tokens": tier.max_tokens,
                 "messages": messages,
             }
-            response = requests.post(self.url, headers=self.headers, json=data)
-            resp_json = response.json()
+            resp_json = get_rate_limiter().call(
+                self._post_messages,
+                data,
+                stage="advisor",
+                estimated_tokens=estimate_tokens(messages, data["max_tokens"]),
+                model_id=tier.model_id,
+            )
             if "content" in resp_json and isinstance(resp_json["content"], list):
                 assistant_message = resp_json["content"][0]["text"]
             else:
                 print("Erreur ou format inattendu :", resp_json)
                 break
+            assistant_message = self._handle_slots(assistant_message)
             history.append({"role": "assistant", "content": assistant_message})
 
             if assistant_message.strip().startswith("{"):
                 print("Final JSON:", assistant_message)
-                raw_criteria = json.loads(assistant_message)
-                
-                # Transform to the required format
-                criteria = {
-                    "type": raw_criteria.get("type", ""),
-                    "style": raw_criteria.get("style", ""),
-                    "season": raw_criteria.get("season", ""),
-                    "budget": raw_criteria.get("budget", []),
-                    "material": raw_criteria.get("materials", []) if isinstance(raw_criteria.get("materials"), list) else [raw_criteria.get("materials", "")],
-                    "colors": raw_criteria.get("colors", []) if isinstance(raw_criteria.get("colors"), list) else [raw_criteria.get("colors", "")],
-                    "brands": raw_criteria.get("brands", []) if isinstance(raw_criteria.get("brands"), list) else [raw_criteria.get("brands", "")] if raw_criteria.get("brands") else [],
-                    "occasion": raw_criteria.get("second-hand acceptable", True)
-                }
-                return criteria
\ No newline at end of file
+                self.raw_criteria = json.loads(assistant_message)
+                return self.to_criteria(self.raw_criteria)
+
+    def refine_criteria(self, feedback):
+        """Apply the user's feedback on the proposed products to the dialogue criteria, in one model call."""
+        if self.raw_criteria is None:
+            raise ValueError("run_dialogue must collect criteria before they can be refined")
+
+        messages = [
+            {
+                "role": "user",
+                "content": (
+                    "You are a smart shopping advisor. Here are the criteria collected from the user, "
+                    f"as JSON: {json.dumps(self.raw_criteria)}\n"
+                    f"The user gave this feedback on the proposed products: {feedback}\n"
+                    "Output ONLY the updated JSON object with the same keys, changing only what the feedback asks for."
+                ),
+            }
+        ]
+        tier = get_tier("advisor")
+        data = {
+            "model": tier.model_id,
+            "max_tokens": tier.max_tokens,
+            "messages": messages,
+        }
+        resp_json = get_rate_limiter().call(
+            self._post_messages,
+            data,
+            stage="advisor",
+            estimated_tokens=estimate_tokens(messages, data["max_tokens"]),
+            model_id=tier.model_id,
+        )
+        try:
+            answer = resp_json["content"][0]["text"]
+            updated = json.loads(answer[answer.index("{") : answer.rindex("}") + 1])
+            if isinstance(updated, dict):
+                self.raw_criteria = {**self.raw_criteria, **updated}
+        except (KeyError, IndexError, ValueError) as e:
+            print(f"Could not apply feedback, keeping criteria: {e}")
+        print("Refined criteria:", self.raw_criteria)
+        return self.to_criteria(self.raw_criteria)
+
+    def _handle_slots(self, assistant_message):
+        """Strip the <slots> trailer from a reply and report the partial criteria it carries."""
+        match = SLOTS_PATTERN.search(assistant_message)
+        if not match:
+            return assistant_message
+        if self.on_partial_criteria is not None:
+            try:
+                partial = json.loads(match.group(1))
+                if isinstance(partial, dict):
+                    self.on_partial_criteria(self.to_criteria(partial))
+            except (ValueError, TypeError) as e:
+                print(f"Ignoring malformed slots: {e}")
+        return SLOTS_PATTERN.sub("", assistant_message).strip()
+
+    @staticmethod
+    def to_criteria(raw_criteria):
+        """Transform the advisor's JSON answer to the criteria format of ProductSheetAgent."""
+        return {
+            "type": raw_criteria.get("type", ""),
+            "style": raw_criteria.get("style", ""),
+            "season": raw_criteria.get("season", ""),
+            "budget": raw_criteria.get("budget", []),
+            "material": raw_criteria.get("materials", []) if isinstance(raw_criteria.get("materials"), list) else [raw_criteria.get("materials", "")],
+            "colors": raw_criteria.get("colors", []) if isinstance(raw_criteria.get("colors"), list) else [raw_criteria.get("colors", "")],
+            "brands": raw_criteria.get("brands", []) if isinstance(raw_criteria.get("brands"), list) else [raw_criteria.get("brands", "")] if raw_criteria.get("brands") else [],
+            "occasion": raw_criteria.get("second-hand acceptable", True)
+        }
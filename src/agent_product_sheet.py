@@ -1,11 +1,32 @@
-from smolagents import CodeAgent, LiteLLMModel, DuckDuckGoSearchTool, Tool
-from typing import List, Dict, Any, Union
+from smolagents import CodeAgent, LiteLLMModel, Tool
+from typing import List, Dict, Any, Optional, Union
 import json
 import os
 import dotenv
+import numpy as np
+
+from constraints import ConstraintSet, parse_amount
+from deadline import current_deadline, is_deadline_exceeded
+from dedup import NearDuplicateIndex, dedupe_products
+from product_catalog import ProductCatalog
+from product_record import ProductBatch, ProductRecord
+from prompt_templates import (
+    EXTRACTION_INSTRUCTIONS,
+    EXTRACTION_TASK,
+    JUDGE_PROMPT,
+    canonical_criteria,
+    mark_cached,
+)
+from search_providers import SearchResult, SearchTool, search_results
+from snippet_ranker import rank_snippets
+from model_tiers import get_stage_model
+from rate_limiter import with_rate_limit
 
 dotenv.load_dotenv()
 
+# Criteria the LLM judge scores against; a budget change only moves the hard limits
+SCORING_KEYS = ("type", "style", "season", "occasion", "materials", "colors", "brands")
+
 
 class LLMJudgeTool(Tool):
     name = "llm_judge_scorer"
@@ -19,25 +40,19 @@ class LLMJudgeTool(Tool):
     def __init__(self, model=None):
         super().__init__()
         self.model = model
+        # Prompt prefix compiled for the criteria of the current request
+        self._criteria = None
+        self._prompt = None
 
     def forward(self, product: str, criteria: str) -> str:
-        import json
-
-        prompt = f"""Score this product 0-100 based on the criteria.
-Criteria: {criteria}
-Product: {product}
-
-Consider:
-- How well the product matches the style, season, and occasion
-- Material compatibility with criteria
-- Color match with preferences
-- Overall suitability
-
-Return only a single number (0-100): """
+        """Score as a string, or "" if the product could not be judged (never a made-up score)"""
+        if criteria != self._criteria:
+            self._criteria = criteria
+            self._prompt = JUDGE_PROMPT.bind(criteria=criteria)
 
         try:
             if self.model:
-                messages = [{"role": "user", "content": prompt}]
+                messages = self._prompt.messages(product=product)
                 response = self.model(messages)
                 print(f"LLM response: {response}")
 
@@ -45,28 +60,52 @@ Return only a single number (0-100): """
                 import re
 
                 # Look for a number (0-100)
-                score_match = re.search(r"\b(\d{1,3})\b", str(response))
-                if score_match:
-                    score = min(100, max(0, int(score_match.group(1))))
-                else:
-                    score = 70  # Default score
-
-                return str(score)
+                score_match = re.search(
+                    r"\b(\d{1,3})\b", str(getattr(response, "content", response))
+                )
+                if not score_match:
+                    print(f"LLM judge gave no score: {response}")
+                    return ""
+                return str(min(100, max(0, int(score_match.group(1)))))
             else:
-                return "60"
+                print("LLM judge has no model, product left unscored")
+                return ""
         except Exception as e:
-            print(f"LLM judge error: {e}")
-            return "60"
+            # The caller reports deadline expiry as partial results
+            if is_deadline_exceeded(e):
+                raise
+            print(f"LLM judge error ({type(e).__name__}): {e}")
+            return ""
 
 
 class ProductSheetAgent(CodeAgent):
     """Agent for generating product sheets based on product descriptions"""
 
-    def __init__(self, model: LiteLLMModel, max_results=5):
+    def __init__(
+        self,
+        model: Optional[LiteLLMModel] = None,
+        max_results=5,
+        score_threshold=60,
+        max_calls_per_request=30,
+        catalog: Optional[ProductCatalog] = None,
+        use_catalog=True,
+        dedup_threshold=0.7,
+        snippet_min_score=None,
+        prefetcher=None,
+    ):
+        # Every model call goes through the shared rate limiter, tagged by stage. Without
+        # an explicit model, extraction and judging use their own tier (model_tiers)
+        if model is None:
+            judge_model = get_stage_model("judge")
+            model = get_stage_model("extraction")
+        else:
+            judge_model = with_rate_limit(model, "judge")
+            model = with_rate_limit(model, "extraction")
+
         # Initialize tools
         tools = [
-            DuckDuckGoSearchTool(),  # Internet search
-            LLMJudgeTool(model=model),  # Custom scoring tool
+            SearchTool(),  # Internet search (hedged over the configured providers)
+            LLMJudgeTool(model=judge_model),  # Custom scoring tool
         ]
 
         # name and description for the agent
@@ -78,17 +117,65 @@ class ProductSheetAgent(CodeAgent):
         )
 
         # Store tools separately for direct access
-        self.judge_tool = LLMJudgeTool(model=model)
+        self.judge_tool = LLMJudgeTool(model=judge_model)
         self.max_results = max_results
 
+        # Early stopping: stop extracting once `max_results` products score at least
+        # `score_threshold`, or once the per-request budget of extract/judge calls is spent
+        self.score_threshold = score_threshold
+        self.max_calls_per_request = max_calls_per_request
+        self.calls_left = max_calls_per_request
+        self.good_found = 0
+        # Products the judge was asked about this request, by id (records are unhashable),
+        # so one it could not score is not judged again
+        self.judged: Dict[int, ProductRecord] = {}
+
+        # Local catalog of previously extracted products, consulted before web search
+        if use_catalog and catalog is None:
+            catalog = ProductCatalog()
+        self.catalog = catalog if use_catalog else None
+
+        # Near-duplicate detection, so the same product is only judged and priced once
+        self.dedup_threshold = dedup_threshold
+        self.seen_products = NearDuplicateIndex(threshold=dedup_threshold)
+
+        # Budget/brand/material limits of the current request, checked at every stage
+        self.constraints = ConstraintSet([])
+
+        # Snippets are extracted in BM25 relevance order; below this score they are dropped
+        self.snippet_min_score = snippet_min_score
+
+        # Optional SpeculativePrefetcher fed by the advisor dialogue
+        self.prefetcher = prefetcher
+
+        # Kept between rounds so refine_product_sheets only redoes what the feedback changed
+        self.pool: List[ProductRecord] = []
+        self.last_criteria: Optional[Dict[str, Any]] = None
+        self.searched_queries = set()
+        self.rejected = NearDuplicateIndex(threshold=dedup_threshold)
+
+        # Criteria serialized once per request for the judge prompts
+        self._criteria_source = None
+        self._criteria_text = ""
+
         super().__init__(
             tools=tools,
             model=model,
             name=self.name,
             description=self.description,
+            # Static extraction instructions live in the (cached) system prompt,
+            # each extraction task only carries its snippet
+            instructions=EXTRACTION_INSTRUCTIONS,
         )
 
-    def generate_product_sheets(self, criteria: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def write_memory_to_messages(self, summary_mode: bool = False):
+        """Agent messages with the system prompt marked for provider-side prompt caching"""
+        messages = super().write_memory_to_messages(summary_mode=summary_mode)
+        if messages and messages[0].role == "system":
+            messages[0].content = mark_cached(messages[0].content)
+        return messages
+
+    def generate_product_sheets(self, criteria: Dict[str, Any]) -> List[ProductRecord]:
         """
         Main pipeline method to generate product sheets
 
@@ -100,18 +187,133 @@ class ProductSheetAgent(CodeAgent):
         """
         # Step 1: Receive and validate criteria
         validated_criteria = self._validate_criteria(criteria)
+        self.calls_left = self.max_calls_per_request
+        self.good_found = 0
+        self.judged = {}
+        self.seen_products.clear()
+        self.constraints = ConstraintSet.from_criteria(validated_criteria)
+        self.searched_queries = set()
+        self.rejected.clear()
+
+        # Step 2: Look up the local catalog and the products prefetched during the
+        # dialogue first, then search the web for the shortfall
+        search_results = self._search_catalog(validated_criteria)
+        if self.prefetcher is not None and self.good_found < self.max_results:
+            search_results += self._score_candidates(
+                self.prefetcher.take(validated_criteria), validated_criteria, "prefetched"
+            )
+        if self.good_found < self.max_results:
+            # Extracted and scored incrementally
+            search_results = self._remove_duplicates(
+                search_results + self._search_products(validated_criteria)
+            )
 
-        # Step 2: Search for corresponding products
-        search_results = self._search_products(validated_criteria)
-
-        # Step 3: Calculate scores for each product
+        # Step 3: Score any product that was not scored during extraction
         scored_products = self._calculate_scores(search_results, validated_criteria)
+        self.pool = scored_products
+        self.last_criteria = validated_criteria
 
         # Step 4: Format as product sheets
         product_sheets = self._format_product_sheets(scored_products)
 
         return product_sheets
 
+    def refine_product_sheets(
+        self, criteria: Dict[str, Any], rejected: List[ProductRecord] = ()
+    ) -> List[ProductRecord]:
+        """
+        Next round of generate_product_sheets after user feedback, reusing the previous rounds
+
+        Rejected products (and their near-duplicates) never come back. Products already in
+        the pool are re-judged only if a criterion the judge sees changed, and the web is
+        searched for the shortfall with queries that were not tried yet.
+
+        Args:
+            criteria: Updated criteria, same format as generate_product_sheets
+            rejected: Products the user turned down in the previous round
+
+        Returns:
+            List of product sheets with brand, size, name, color, matching_score
+        """
+        if self.last_criteria is None:
+            return self.generate_product_sheets(criteria)
+
+        validated_criteria = self._validate_criteria(criteria)
+        changed = [
+            key
+            for key in validated_criteria
+            if validated_criteria[key] != self.last_criteria.get(key)
+        ]
+        rescore = any(key in SCORING_KEYS for key in changed)
+        print(f"Refining with changed criteria: {changed or 'none'}")
+
+        for product in rejected:
+            self.rejected.add(product)
+        self.calls_left = self.max_calls_per_request
+        self.good_found = 0
+        self.judged = {}
+        self.constraints = ConstraintSet.from_criteria(validated_criteria)
+
+        # Rejected products stay in the seen index so they are not extracted again
+        self.seen_products.clear()
+        for product in self.rejected.products:
+            self.seen_products.add(product)
+
+        kept, candidates = [], []
+        for product in self.pool:
+            if self.rejected.find(product) is not None:
+                continue
+            self.seen_products.add(product)
+            kept.append(product)
+            if rescore:
+                product["matching_score"] = None
+            if not self.constraints.accepts(product, "pool"):
+                continue
+            if product["matching_score"] is None and self._spend_call():
+                self._score_product(product, validated_criteria)
+            if self._is_good(product):
+                self.good_found += 1
+            candidates.append(product)
+        print(
+            f"Reusing {len(candidates)} products from previous rounds ({self.good_found} good), "
+            f"{'re-scored' if rescore else 'scores kept'}"
+        )
+
+        new_products = []
+        if self.good_found < self.max_results:
+            new_products = self._search_products(validated_criteria)
+
+        scored_products = self._calculate_scores(
+            self._remove_duplicates(candidates + new_products), validated_criteria
+        )
+        self.pool = self._remove_duplicates(kept + new_products)
+        self.last_criteria = validated_criteria
+
+        return self._format_product_sheets(scored_products)
+
+    def get_state(self) -> Dict[str, Any]:
+        """What refine_product_sheets needs from earlier rounds, e.g. to checkpoint a session"""
+        return {
+            "pool": self.pool,
+            "last_criteria": self.last_criteria,
+            "searched_queries": sorted(self.searched_queries),
+            "rejected": self.rejected.products,
+        }
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        """Restore the output of get_state (pool, criteria and constraints of the last round)"""
+        self.pool = list(state.get("pool", []))
+        self.last_criteria = state.get("last_criteria")
+        self.searched_queries = set(state.get("searched_queries", []))
+        self.rejected.clear()
+        for product in state.get("rejected", []):
+            self.rejected.add(product)
+        self.constraints = (
+            ConstraintSet.from_criteria(self.last_criteria)
+            if self.last_criteria is not None
+            else ConstraintSet([])
+        )
+
     def _validate_criteria(self, criteria: Dict[str, Any]) -> Dict[str, Any]:
         """Validate and normalize input criteria"""
 
@@ -131,6 +333,10 @@ class ProductSheetAgent(CodeAgent):
         if isinstance(budget, list) and len(budget) == 2:
             validated["budget_min"] = budget[0]
             validated["budget_max"] = budget[1]
+        elif isinstance(budget, (int, float, str)) and budget not in ("", True, False):
+            # A single amount ("40 euro") is the maximum
+            validated["budget_min"] = 0
+            validated["budget_max"] = budget
         else:
             validated["budget_min"] = 0
             validated["budget_max"] = float("inf")
@@ -150,14 +356,59 @@ class ProductSheetAgent(CodeAgent):
         print(f"Validated criteria: {json.dumps(validated, indent=2)}")
         return validated
 
-    def _search_products(self, criteria: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def _search_catalog(self, criteria: Dict[str, Any]) -> List[ProductRecord]:
+        """Score fresh catalog matches, counting them towards the early-stop target"""
+        if self.catalog is None:
+            return []
+
+        cached_products = self.catalog.search(criteria, limit=self.max_results)
+        print(f"Found {len(cached_products)} products in local catalog")
+        return self._score_candidates(cached_products, criteria, "catalog")
+
+    def _score_candidates(
+        self, products: List[ProductRecord], criteria: Dict[str, Any], stage: str
+    ) -> List[ProductRecord]:
+        """Dedupe, constrain and score ready-made candidates (catalog hits, prefetched products)"""
+        accepted = []
+        for product in products:
+            if self.good_found >= self.max_results:
+                break
+            if self.seen_products.find(product) is not None:
+                continue
+            if not self.constraints.accepts(product, stage):
+                continue
+            self.seen_products.add(product)
+            accepted.append(product)
+
+            if not self._spend_call():
+                break
+            self._score_product(product, criteria)
+            if self._is_good(product):
+                self.good_found += 1
+
+        return accepted
+
+    def prefetch_products(self, criteria: Dict[str, Any]) -> List[ProductRecord]:
+        """Search and extract (without scoring) for partially known criteria.
+
+        Used by SpeculativePrefetcher while the advisor dialogue is still running;
+        scoring waits for the final criteria.
+        """
+        validated_criteria = self._validate_criteria(criteria)
+        self.calls_left = self.max_calls_per_request
+        self.seen_products.clear()
+        self.constraints = ConstraintSet([])
+
+        query = self._build_search_queries(validated_criteria)[0]
+        return self._parse_search_results(search_results(query))
+
+    def _search_products(self, criteria: Dict[str, Any]) -> List[ProductRecord]:
         """Search for products using multiple sources"""
         all_results = []
         print("Building search queries based on criteria...")
 
         # Build multiple search queries for different combinations
         search_queries = self._build_search_queries(criteria)
-        ddg_tool = DuckDuckGoSearchTool()  # Internet search tool
 
         forum_tool = None
         press_tool = None
@@ -173,19 +424,31 @@ class ProductSheetAgent(CodeAgent):
 
         print("searching for products:")
 
-        # TODO do for all queries, not just first 3
         print(f"Search queries: {search_queries}")
 
-        query = search_queries[0]  # For testing, use only the first query
+        # Go through the queries until enough good products are found or the budget is spent
+        deadline = current_deadline()
+        for query in search_queries:
+            if self.good_found >= self.max_results or self.calls_left <= 0:
+                break
+            if deadline.expired:
+                deadline.mark_partial()
+                break
+            # Queries of earlier refinement rounds already contributed to the pool
+            if query in self.searched_queries:
+                continue
+            self.searched_queries.add(query)
 
-        try:
-            # internet_results = self.run(f"Search for '{query}' using web search")
-            internet_results = ddg_tool.forward(query=query)
-            print(f"Internet search results for '{query}': {internet_results}")
+            try:
+                # internet_results = self.run(f"Search for '{query}' using web search")
+                internet_results = search_results(query)
+                print(f"Internet search results for '{query}': {internet_results}")
 
-            all_results.extend(self._parse_search_results(internet_results))
-        except Exception as e:
-            print(f"Internet search error: {e}")
+                all_results.extend(
+                    self._parse_search_results(internet_results, criteria)
+                )
+            except Exception as e:
+                print(f"Internet search error: {e}")
 
         # Remove duplicates based on product name or URL
         unique_results = self._remove_duplicates(all_results)
@@ -193,52 +456,93 @@ class ProductSheetAgent(CodeAgent):
         return unique_results
 
     def _calculate_scores(
-        self, products: List[Dict[str, Any]], criteria: Dict[str, Any]
-    ) -> List[Dict[str, Any]]:
+        self, products: List[ProductRecord], criteria: Dict[str, Any]
+    ) -> List[ProductRecord]:
         """Calculate matching scores using LLM judge tool, scoring one product at a time"""
         print("Calculating matching scores for products...")
 
         scored_products = []
 
         for i, product in enumerate(products):
-            print(
-                f"Scoring product {i + 1}/{len(products)}: {product.get('name', 'Unknown')}"
-            )
-
-            try:
-                # Score single product - updated to use 'product' parameter
-                score_str = self.judge_tool.forward(
-                    product=str(product), criteria=str(criteria)
-                )
-                product["matching_score"] = int(score_str)
-
-            except Exception as e:
-                print(f"Error scoring product {product.get('name', 'Unknown')}: {e}")
-                product["matching_score"] = 70
+            # Products judged during extraction keep their score, even an unscored one
+            if product.get("matching_score") is None and id(product) not in self.judged:
+                if not self._spend_call():
+                    print(f"Call budget exhausted, leaving {product.get('name', 'Unknown')} unscored")
+                else:
+                    print(
+                        f"Scoring product {i + 1}/{len(products)}: {product.get('name', 'Unknown')}"
+                    )
+                    self._score_product(product, criteria)
 
             scored_products.append(product)
 
-        # Filter out products with very low scores and sort by score
-        return sorted(
-            [p for p in scored_products if p["matching_score"] > 5],
-            key=lambda x: x["matching_score"],
-            reverse=True,
+        # Filter out products with very low scores and sort by score; products the
+        # judge could not score are kept, after the scored ones
+        batch = ProductBatch.from_records(scored_products)
+        scores = batch.column("matching_score")
+        return (
+            batch.filter(np.isnan(scores) | (scores > 5))
+            .sort_by("matching_score", reverse=True)
+            .records()
         )
 
+    def _score_product(
+        self, product: ProductRecord, criteria: Dict[str, Any]
+    ) -> ProductRecord:
+        """Score a single product in place with the LLM judge
+
+        A product the judge could not score keeps matching_score None (unscored), which
+        never counts as good.
+        """
+        self.judged[id(product)] = product
+        try:
+            # Score single product - updated to use 'product' parameter
+            score_str = self.judge_tool.forward(
+                product=product.to_prompt(), criteria=self._serialize_criteria(criteria)
+            )
+            product["matching_score"] = int(score_str) if score_str else None
+
+        except Exception as e:
+            print(f"Error scoring product {product.get('name', 'Unknown')}: {e}")
+            if is_deadline_exceeded(e):
+                # Not judged in time
+                current_deadline().mark_partial()
+            product["matching_score"] = None
+
+        return product
+
+    def _is_good(self, product: ProductRecord) -> bool:
+        """Scored at or above score_threshold (unscored products never are)"""
+        score = product.get("matching_score")
+        return score is not None and score >= self.score_threshold
+
+    def _serialize_criteria(self, criteria: Dict[str, Any]) -> str:
+        """Canonical compact criteria, serialized once per criteria object"""
+        if criteria is not self._criteria_source:
+            self._criteria_source = criteria
+            self._criteria_text = canonical_criteria(criteria)
+        return self._criteria_text
+
+    def _spend_call(self) -> bool:
+        """Take one call from the per-request budget, False if it is exhausted"""
+        if self.calls_left <= 0:
+            return False
+        self.calls_left -= 1
+        return True
+
     def _format_product_sheets(
-        self, products: List[Dict[str, Any]]
-    ) -> List[Dict[str, Any]]:
+        self, products: List[ProductRecord]
+    ) -> List[ProductRecord]:
         """Format products into standardized product sheets"""
         product_sheets = []
 
         for product in products:
-            sheet = {
-                "brand": product.get("brand", "Unknown"),
-                "size": product.get("size", "Unknown"),
-                "name": product.get("name", "Unknown"),
-                "color": product.get("color", "Unknown"),
-                #"matching_score": product.get("matching_score", 0.0),
-            }
+            sheet = product.copy(
+                brand=product.get("brand", "Unknown"),
+                size=product.get("size", "Unknown"),
+                name=product.get("name", "Unknown"),
+                color=product.get("color", "Unknown"),
+            )
             product_sheets.append(sheet)
 
         return product_sheets[:20]
@@ -276,63 +580,55 @@ class ProductSheetAgent(CodeAgent):
         return list(set(queries))
 
     def _remove_duplicates(
-        self, products: List[Dict[str, Any]]
-    ) -> List[Dict[str, Any]]:
-        """Remove duplicate products based on name and brand"""
-        seen = set()
-        unique_products = []
-
-        for product in products:
-            identifier = f"{product.get('name', '')}-{product.get('brand', '')}"
-            if identifier not in seen:
-                seen.add(identifier)
-                unique_products.append(product)
-
-        return unique_products
-
-    def _parse_search_results(self, results: Any) -> List[Dict[str, Any]]:
-        """Parse internet search results one by one using LLM capabilities"""
-
-        # Convert results to string if needed
-        if not isinstance(results, str):
-            results_str = str(results)
-        else:
-            results_str = results
-
-        print(f"Parsing search results: {results_str[:200]}...")
-
-        # First, split the results into individual items
-        individual_results = self._split_search_results(results_str)
+        self, products: List[ProductRecord]
+    ) -> List[ProductRecord]:
+        """Remove near-duplicate products (normalized name and brand, MinHash similarity)"""
+        return dedupe_products(products, threshold=self.dedup_threshold)
+
+    def _parse_search_results(
+        self, results: List[SearchResult], criteria: Dict[str, Any] = None
+    ) -> List[ProductRecord]:
+        """Parse internet search results one by one using LLM capabilities.
+
+        Each search result (title, url, snippet) is one extraction task.
+        When criteria are given, each product is scored as soon as it is extracted and
+        extraction stops once `max_results` products reach `score_threshold` or the
+        per-request call budget runs out.
+        """
+        # Results without any text cannot hold a product
+        individual_results = [result for result in results if result.title or result.snippet]
+        print(f"Parsing {len(individual_results)} search results")
+
+        # Spend the extraction calls on the most relevant snippets first
+        if criteria is not None:
+            ranked = rank_snippets(
+                individual_results, criteria, min_score=self.snippet_min_score
+            )
+            print(
+                f"Ranked {len(individual_results)} results by relevance, keeping {len(ranked)}"
+            )
+            individual_results = [snippet for snippet, _ in ranked]
 
         all_products = []
+        deadline = current_deadline()
 
         # Process each result individually
         for i, single_result in enumerate(individual_results):
+            if deadline.expired:
+                deadline.mark_partial()
+                break
+            if not self._spend_call():
+                print("Call budget exhausted, stopping extraction")
+                break
             print(f"Processing result {i + 1}/{len(individual_results)}")
 
-            extraction_prompt = f"""
-    Extract fashion product information from this search result and return ONLY a Python dictionary.
-
-    If this contains a fashion product, return a dictionary with these keys:
-    - name: product name
-    - brand: brand name or "Unknown"  
-    - color: color or "Various"
-    - size: size or "Various"
-    - price: price in euros (number) or 50 if unknown
-    - material: material or "Mixed"
-    - type: product category
-
-    Return ONLY the dictionary, nothing else. Example:
-    {{"name": "Product Name", "brand": "Brand", "color": "Color", "size": "Size", "price": 50, "material": "Material", "type": "type"}}
-
-    If no fashion product found, return an empty dictionary: {{}}
-
-    Search result: {single_result}
-    """
+            extraction_prompt = EXTRACTION_TASK.substitute(snippet=single_result.to_prompt())
 
             try:
-                # Use the agent's run method for each individual result
-                extraction_response = self.run(extraction_prompt, max_steps=5)
+                # Use the agent's run method for each individual result,
+                # interrupted at its next step if the deadline expires
+                with deadline.on_cancel(self.interrupt):
+                    extraction_response = self.run(extraction_prompt, max_steps=5)
                 print(
                     f"Agent extraction response for result {i + 1}: {extraction_response}"
                 )
@@ -345,12 +641,39 @@ class ProductSheetAgent(CodeAgent):
                     product = self._safe_eval_single_response(extraction_response)
 
                 if product and product.get("name"):  # Only add if valid product found
+                    if self.catalog is not None:
+                        self.catalog.upsert(product)
+                    duplicate = self.seen_products.find(product)
+                    if duplicate is not None:
+                        print(
+                            f"Skipping {product['name']}: near-duplicate of {duplicate.get('name')}"
+                        )
+                        continue
+                    # Over-budget / wrong-brand / wrong-material products are not judged
+                    if not self.constraints.accepts(product, "extracted"):
+                        continue
+                    self.seen_products.add(product)
                     all_products.append(product)
                     print(
                         f"Successfully extracted product: {product.get('name', 'Unknown')}"
                     )
-                    # for testing we stop after 2 products
-                    if len(all_products) >= self.max_results:
+
+                    if criteria is None:
+                        if len(all_products) >= self.max_results:
+                            break
+                        continue
+
+                    # Score right away so we can stop as soon as we have enough good ones
+                    if not self._spend_call():
+                        print("Call budget exhausted, stopping extraction")
+                        break
+                    self._score_product(product, criteria)
+                    if self._is_good(product):
+                        self.good_found += 1
+                    if self.good_found >= self.max_results:
+                        print(
+                            f"Found {self.good_found} products scoring >= {self.score_threshold}, stopping early"
+                        )
                         break
 
                 else:
@@ -363,7 +686,7 @@ class ProductSheetAgent(CodeAgent):
         print(f"Successfully extracted {len(all_products)} products total")
         return all_products
 
-    def _extract_final_answer(self, response: str) -> Dict[str, Any]:
+    def _extract_final_answer(self, response: str) -> Optional[ProductRecord]:
         """Extract the final answer from agent response"""
         try:
             import re
@@ -378,76 +701,15 @@ class ProductSheetAgent(CodeAgent):
                 product = ast.literal_eval(dict_str)
                 return self._validate_single_product(product)
 
-            return {}
+            return None
 
         except Exception as e:
             print(f"Error extracting final answer: {e}")
-            return {}
-
-    def _split_search_results(self, results_str: str) -> List[str]:
-        """Split search results into individual items"""
-        try:
-            # Try to intelligently split results based on common patterns
-
-            # Split by common delimiters that indicate separate results
-            # This is a simple approach - you might need to adjust based on your search tool's output format
-
-            # First try splitting by double newlines (common in search results)
-            if "\n\n" in results_str:
-                individual_results = [
-                    result.strip()
-                    for result in results_str.split("\n\n")
-                    if result.strip()
-                ]
-
-            # If no double newlines, try splitting by single newlines and group by patterns
-            elif "\n" in results_str:
-                lines = [
-                    line.strip() for line in results_str.split("\n") if line.strip()
-                ]
-
-                # Group lines that seem to belong to the same result
-                individual_results = []
-                current_result = []
-
-                for line in lines:
-                    # Check if this line starts a new result (common patterns)
-                    if (
-                        line.startswith("http")
-                        or line.startswith("Title:")
-                        or line.startswith("•")
-                        or line.startswith("-")
-                        or len(line) > 50
-                    ):  # Likely a title or description
-                        if current_result:
-                            individual_results.append("\n".join(current_result))
-                            current_result = []
-
-                    current_result.append(line)
-
-                # Add the last result
-                if current_result:
-                    individual_results.append("\n".join(current_result))
-
-            else:
-                # If no clear separators, treat as one result
-                individual_results = [results_str]
-
-            # Filter out very short results that are unlikely to contain product info
-            individual_results = [
-                result for result in individual_results if len(result) > 20
-            ]
-
-            print(f"Split into {len(individual_results)} individual results")
-            return individual_results
-
-        except Exception as e:
-            print(f"Error splitting results: {e}")
-            return [results_str]  # Fallback to original string
+            return None
 
     def _safe_eval_single_response(
         self, response: Union[str, Dict[str, Any]]
-    ) -> Dict[str, Any]:
+    ) -> Optional[ProductRecord]:
         """Safely evaluate LLM response as a single Python dictionary"""
         try:
             import ast
@@ -466,7 +728,7 @@ class ProductSheetAgent(CodeAgent):
 
             # Handle empty response
             if response in ["{}", "", "None", "null"]:
-                return {}
+                return None
 
             # Try to find dictionary pattern
             dict_match = re.search(r"\{.*\}", response, re.DOTALL)
@@ -479,89 +741,78 @@ class ProductSheetAgent(CodeAgent):
                 if isinstance(product, dict):
                     return self._validate_single_product(product)
 
-            return {}
+            return None
 
         except Exception as e:
             print(f"Error parsing single LLM response: {e}")
-            return {}
+            return None
 
-    def _validate_single_product(self, product: Dict[str, Any]) -> Dict[str, Any]:
+    def _validate_single_product(self, product: Dict[str, Any]) -> Optional[ProductRecord]:
         """Validate and normalize a single product dictionary"""
         if not product or not isinstance(product, dict):
-            return {}
+            return None
 
         # Ensure required fields exist with defaults
-        validated_product = {
-            "name": product.get("name", "Unknown Product"),
-            "brand": product.get("brand", "Unknown"),
-            "color": product.get("color", "Various"),
-            "size": product.get("size", "Various"),
-            "price": self._safe_convert_price(product.get("price", 50)),
-            "material": product.get("material", "Mixed"),
-            "type": product.get("type", "clothing"),
-        }
+        validated_product = ProductRecord(
+            name=product.get("name", "Unknown Product"),
+            brand=product.get("brand", "Unknown"),
+            color=product.get("color", "Various"),
+            size=product.get("size", "Various"),
+            price=self._safe_convert_price(product.get("price")),
+            material=product.get("material", "Mixed"),
+            type=product.get("type", "clothing"),
+        )
 
         # Only return if we have a meaningful name
-        if validated_product["name"] in ["Unknown Product", "", None]:
-            return {}
+        if validated_product.name in ["Unknown Product", "", None]:
+            return None
 
         return validated_product
 
-    def _safe_convert_price(self, price_value: Any) -> int:
-        """Safely convert price to integer"""
-        try:
-            if isinstance(price_value, (int, float)):
-                return int(price_value)
-            elif isinstance(price_value, str):
-                # Extract numeric value from string
-                import re
+    def _safe_convert_price(self, price_value: Any) -> Optional[int]:
+        """Safely convert price to integer, None when the price is unknown"""
+        price = parse_amount(price_value)
+        return int(price) if price is not None else None
 
-                price_match = re.search(r"(\d+)", price_value)
-                if price_match:
-                    return int(price_match.group(1))
-            return 50  # Default price
-        except:
-            return 50
-
-    def _parse_forum_results(self, results: Any) -> List[Dict[str, Any]]:
+    def _parse_forum_results(self, results: Any) -> List[ProductRecord]:
         """Parse forum search results"""
         # Mock some results for testing
         return [
-            {
-                "name": "Casual Chic Dress",
-                "brand": "Forum Recommended",
-                "color": "Pastel Pink",
-                "size": "S",
-                "price": 65,
-                "material": "Linen",
-                "type": "dress",
-            }
+            ProductRecord(
+                name="Casual Chic Dress",
+                brand="Forum Recommended",
+                color="Pastel Pink",
+                size="S",
+                price=65,
+                material="Linen",
+                type="dress",
+            )
         ]
 
-    def _parse_press_results(self, results: Any) -> List[Dict[str, Any]]:
+    def _parse_press_results(self, results: Any) -> List[ProductRecord]:
         """Parse press article results"""
         # Mock some results for testing
         return [
-            {
-                "name": "Designer Summer Dress",
-                "brand": "Press Featured",
-                "color": "Light Green",
-                "size": "L",
-                "price": 85,
-                "material": "Light Silk",
-                "type": "dress",
-            }
+            ProductRecord(
+                name="Designer Summer Dress",
+                brand="Press Featured",
+                color="Light Green",
+                size="L",
+                price=85,
+                material="Light Silk",
+                type="dress",
+            )
         ]
 
 
 anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
-model_id = "claude-3-haiku-20240307"
 
 
 """
 HOW TO USE:
 
-agent = ProductSheetAgent(model_id=model_id, max_results=5)
+# Extraction and judge models come from model_tiers (FASHION_AGENT_EXTRACTION_MODEL, ...)
+agent = ProductSheetAgent(max_results=5)
 criteria = {
     "type": "shirt",
     "style": "casual",
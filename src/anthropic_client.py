@@ -1,22 +1,41 @@
-import anthropic
 from dotenv import load_dotenv
-from smolagents import LiteLLMModel
 import os
 
 load_dotenv()
-api_key = os.getenv("ANTHROPIC_API_KEY")
 
-if api_key is None:
-     print("api_key not found in environment!")
+_client = None
+
+
+def get_client():
+    """Build the shared LiteLLMModel on first use (nothing is constructed at import)."""
+    global _client
+    if _client is None:
+        from smolagents import LiteLLMModel
+        from model_tiers import get_tier
+
+        api_key = os.getenv("ANTHROPIC_API_KEY")
+        if api_key is None:
+            print("api_key not found in environment!")
+
+        tier = get_tier("default")
+        _client = LiteLLMModel(
+            model_id=tier.model_id,
+            temperature=0.1,
+            max_tokens=tier.max_tokens,
+            api_key = api_key)
+    return _client
+
+
+def __getattr__(name):
+    # Keeps `from anthropic_client import client` working, built lazily on access
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-client = LiteLLMModel(
-    model_id="claude-3-5-haiku-latest",
-    temperature=0.1,
-    api_key = api_key)
 
 if __name__=="__main__":
-    response = client.generate(
+    response = get_client().generate(
         messages=[
             {"role": "user", "content": "Explain quantum computing in simple terms."}
         ])
-    print(response.content)
\ No newline at end of file
+    print(response.content)
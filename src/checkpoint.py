@@ -0,0 +1,135 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, List, Optional
+
+from dotenv import load_dotenv
+
+from product_record import ProductRecord
+
+load_dotenv()
+
+DEFAULT_CHECKPOINT_PATH = os.getenv("FASHION_AGENT_CHECKPOINTS", "checkpoints.db")
+
+_RECORD_TAG = "__product__"
+
+
+def _encode(value: Any) -> Any:
+    """JSON-ready copy of a stage output; ProductRecords are tagged so they come back as records."""
+    if isinstance(value, ProductRecord):
+        return {_RECORD_TAG: value.to_dict()}
+    if isinstance(value, dict):
+        return {str(key): _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(obj: dict) -> Any:
+    if _RECORD_TAG in obj and len(obj) == 1:
+        return ProductRecord.from_dict(obj[_RECORD_TAG])
+    return obj
+
+
+def dumps(value: Any) -> bytes:
+    """Compact stage payload: zlib-compressed JSON."""
+    text = json.dumps(_encode(value), separators=(",", ":"), default=str)
+    return zlib.compress(text.encode("utf-8"))
+
+
+def loads(payload: bytes) -> Any:
+    return json.loads(zlib.decompress(payload).decode("utf-8"), object_hook=_decode)
+
+
+class CheckpointStore:
+    """SQLite store of pipeline stage outputs, keyed by (session, stage).
+
+    Every completed stage (criteria, product sheets, prices, image URLs,
+    selection) is saved as soon as it is produced, so a failed or interrupted
+    run can be resumed from the last completed stage without paying again for
+    the model calls before it.
+    """
+
+    def __init__(self, path: str = DEFAULT_CHECKPOINT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    session_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (session_id, stage)
+                )
+                """
+            )
+
+    def save(self, session_id: str, stage: str, value: Any) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (session_id, stage, payload, created_at) VALUES (?, ?, ?, ?)",
+                (session_id, stage, dumps(value), time.time()),
+            )
+
+    def load(self, session_id: str, stage: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM checkpoints WHERE session_id = ? AND stage = ?",
+                (session_id, stage),
+            ).fetchone()
+        return loads(row[0]) if row is not None else default
+
+    def stages(self, session_id: str) -> List[str]:
+        """Completed stages of a session, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage FROM checkpoints WHERE session_id = ? ORDER BY created_at",
+                (session_id,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def latest_session(self) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT session_id FROM checkpoints ORDER BY created_at DESC LIMIT 1"
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def session(self, session_id: Optional[str] = None) -> "CheckpointSession":
+        """A new session, or an existing one to resume ("last" for the most recent)."""
+        if session_id == "last":
+            session_id = self.latest_session()
+            if session_id is None:
+                raise ValueError("No checkpointed session to resume")
+        return CheckpointSession(self, session_id or uuid.uuid4().hex[:12])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CheckpointSession:
+    """Stage outputs of one pipeline run."""
+
+    def __init__(self, store: CheckpointStore, session_id: str):
+        self.store = store
+        self.id = session_id
+
+    def save(self, stage: str, value: Any) -> None:
+        self.store.save(self.id, stage, value)
+
+    def load(self, stage: str, default: Any = None) -> Any:
+        value = self.store.load(self.id, stage, default)
+        if value is not default:
+            print(f"Resuming session {self.id}: reusing checkpointed '{stage}'")
+        return value
+
+    def stages(self) -> List[str]:
+        return self.store.stages(self.id)
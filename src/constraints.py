@@ -0,0 +1,132 @@
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from dedup import PLACEHOLDER_VALUES, normalize_tokens
+
+
+class Constraint:
+    """A named predicate over a product; `check` returns False to prune it."""
+
+    def __init__(self, name: str, check: Callable[[Any], bool]):
+        self.name = name
+        self.check = check
+
+
+def parse_amount(value: Any) -> Optional[float]:
+    """Amount in euros from a number or a text such as "40 euro" or "€29,90"; None if there is none."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return None if math.isnan(value) else float(value)
+    match = re.search(r"\d+(?:[.,]\d+)?", str(value).replace(" ", ""))
+    return float(match.group(0).replace(",", ".")) if match else None
+
+
+def _budget_constraint(budget_min: float, budget_max: float) -> Constraint:
+    def check(product) -> bool:
+        # Unknown prices pass: the price search will tell
+        price = parse_amount(product.get("price"))
+        if price is None:
+            return True
+        return budget_min <= price <= budget_max
+
+    return Constraint("budget", check)
+
+
+def _token_constraint(name: str, field: str, wanted: List[str], also_in_name: bool) -> Constraint:
+    """Product `field` must share a token with one of the wanted values.
+
+    Unknown values (placeholders from extraction) pass, since they cannot be
+    checked yet; a later stage with better data will prune them.
+    """
+    wanted_tokens = [set(normalize_tokens(value)) for value in wanted]
+    wanted_tokens = [tokens for tokens in wanted_tokens if tokens]
+
+    def check(product) -> bool:
+        value = product.get(field)
+        text = str(value or "")
+        if also_in_name:
+            text = f"{text} {product.get('name', '')}"
+        tokens = set(normalize_tokens(text))
+        if any(wanted <= tokens for wanted in wanted_tokens):
+            return True
+        return value in PLACEHOLDER_VALUES or not value
+
+    return Constraint(name, check)
+
+
+class ConstraintSet:
+    """Hard limits from the validated criteria, applied at every pipeline stage.
+
+    Built once per request from `ProductSheetAgent._validate_criteria` output.
+    Each `apply` drops failing products before the next expensive stage
+    (judge, price search, image extraction, gallery) and counts what it pruned.
+    """
+
+    def __init__(self, constraints: Iterable[Constraint]):
+        self.constraints = list(constraints)
+        self.seen: Counter = Counter()
+        self.pruned: Dict[str, Counter] = defaultdict(Counter)
+
+    @classmethod
+    def from_criteria(cls, criteria: Dict[str, Any]) -> "ConstraintSet":
+        constraints = []
+
+        budget_min = parse_amount(criteria.get("budget_min"))
+        budget_max = parse_amount(criteria.get("budget_max"))
+        for bound, raw, parsed in (("min", criteria.get("budget_min"), budget_min),
+                                   ("max", criteria.get("budget_max"), budget_max)):
+            if parsed is None and raw not in (None, "", 0):
+                print(f"Ignoring unreadable budget {bound}: {raw!r}")
+        budget_min = budget_min or 0.0
+        budget_max = float("inf") if budget_max is None else budget_max
+        if budget_min > budget_max:
+            budget_min, budget_max = budget_max, budget_min
+        if budget_min > 0 or budget_max != float("inf"):
+            constraints.append(_budget_constraint(budget_min, budget_max))
+
+        brands = [b for b in criteria.get("brands", []) or [] if b]
+        if brands:
+            constraints.append(_token_constraint("brand", "brand", brands, also_in_name=True))
+
+        materials = [m for m in criteria.get("materials", []) or [] if m]
+        if materials:
+            constraints.append(_token_constraint("material", "material", materials, also_in_name=False))
+
+        return cls(constraints)
+
+    def failed(self, product) -> Optional[str]:
+        """Name of the first constraint the product violates, or None."""
+        for constraint in self.constraints:
+            if not constraint.check(product):
+                return constraint.name
+        return None
+
+    def accepts(self, product, stage: str) -> bool:
+        """Check one product and record the outcome for `stage`."""
+        self.seen[stage] += 1
+        reason = self.failed(product)
+        if reason is None:
+            return True
+        self.pruned[stage][reason] += 1
+        print(f"[{stage}] pruned {product.get('name', 'Unknown')}: {reason} constraint")
+        return False
+
+    def apply(self, products: Iterable, stage: str) -> List:
+        """Keep only the products that satisfy every constraint."""
+        return [product for product in products if self.accepts(product, stage)]
+
+    def report(self) -> str:
+        """One line per stage: how many products were checked and pruned, by constraint."""
+        if not self.seen:
+            return "Constraints: nothing checked"
+        lines = ["Constraint pruning per stage:"]
+        for stage, seen in self.seen.items():
+            pruned = self.pruned.get(stage, Counter())
+            details = ", ".join(f"{name} {count}" for name, count in pruned.most_common())
+            lines.append(
+                f"  {stage}: {sum(pruned.values())}/{seen} pruned" + (f" ({details})" if details else "")
+            )
+        return "\n".join(lines)
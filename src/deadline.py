@@ -0,0 +1,178 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Hard latency SLO of one recommendation request (criteria to gallery, user time excluded); 0 disables it
+DEFAULT_DEADLINE = float(os.getenv("FASHION_AGENT_DEADLINE", 180))
+# Caps of single blocking calls, also applied when no request deadline is running
+PAGE_LOAD_TIMEOUT = float(os.getenv("FASHION_AGENT_PAGE_TIMEOUT", 30))
+HTTP_TIMEOUT = float(os.getenv("FASHION_AGENT_HTTP_TIMEOUT", 60))
+
+# Share of the time left that each stage may use, so a slow stage still leaves
+# the later ones time to turn what it found into something the user can see
+STAGE_SHARES = {
+    "sheets": 0.5,
+    "prices": 0.6,
+    "images": 1.0,
+}
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request deadline expired before this work could run."""
+
+
+def is_deadline_exceeded(error: BaseException) -> bool:
+    """True if `error` is, or was raised from, a DeadlineExceeded (agents wrap model errors)."""
+    while error is not None:
+        if isinstance(error, DeadlineExceeded):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class Deadline:
+    """Time limit of one request, shared by every stage and blocking call it makes.
+
+    Blocking calls take their timeout from `timeout()`, loops check `expired`
+    between items, and long-running work registers a cancel callback with
+    `on_cancel` (e.g. an agent's `interrupt`) that fires as soon as the deadline
+    expires. Stages that stop early call `mark_partial`, so the caller knows the
+    results it gets are the best found in time, not complete ones.
+    """
+
+    def __init__(self, seconds: Optional[float] = None, name: str = "request",
+                 _parent: Optional["Deadline"] = None):
+        self.name = name
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self.partial_stages: List[str] = _parent.partial_stages if _parent else []
+        self._cancelled = threading.Event()
+        self._callbacks: Dict[int, Callable[[], None]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._timer = None
+        if self.expires_at is not None:
+            self._timer = threading.Timer(max(seconds, 0), self.cancel)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (None without a limit)."""
+        if self._cancelled.is_set():
+            return 0.0
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    @property
+    def partial(self) -> bool:
+        return bool(self.partial_stages)
+
+    def check(self, what: str = "") -> None:
+        """Raise DeadlineExceeded if the deadline has expired."""
+        if self.expired:
+            raise DeadlineExceeded(f"{self.name} deadline expired" + (f" before {what}" if what else ""))
+
+    def timeout(self, cap: Optional[float] = None) -> Optional[float]:
+        """Timeout for one blocking call: the time left, at most `cap`; raises if none is left."""
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        return remaining if cap is None else min(remaining, cap)
+
+    def cancel(self) -> None:
+        """Expire now and run the cancel callbacks of the outstanding work."""
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self._cancelled.set()
+            callbacks = list(self._callbacks.values())
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[{self.name}] cancel callback failed: {e}")
+
+    @contextmanager
+    def on_cancel(self, callback: Callable[[], None]) -> Iterator[None]:
+        """Run `callback` if the deadline expires while the block runs (right away if it already has)."""
+        with self._lock:
+            cancelled = self._cancelled.is_set()
+            if not cancelled:
+                handle = self._next_id
+                self._next_id += 1
+                self._callbacks[handle] = callback
+        if cancelled:
+            callback()
+        try:
+            yield
+        finally:
+            if not cancelled:
+                with self._lock:
+                    self._callbacks.pop(handle, None)
+
+    def mark_partial(self, stage: Optional[str] = None) -> None:
+        """Record that `stage` (this deadline's stage by default) returned before finishing its work."""
+        stage = stage or self.name
+        with self._lock:
+            if stage not in self.partial_stages:
+                self.partial_stages.append(stage)
+                print(f"[{stage}] deadline reached, keeping the results found so far")
+
+    @contextmanager
+    def stage(self, name: str, share: Optional[float] = None) -> Iterator["Deadline"]:
+        """Run a stage under its own share of the time left (STAGE_SHARES by default).
+
+        The stage deadline is the current one while the block runs, and is
+        cancelled with this one.
+        """
+        share = STAGE_SHARES.get(name, 1.0) if share is None else share
+        remaining = self.remaining()
+        child = Deadline(
+            remaining * share if remaining is not None else None, name=name, _parent=self
+        )
+        if remaining is not None and remaining <= 0:
+            child.cancel()
+        with self.on_cancel(child.cancel), deadline_scope(child):
+            try:
+                yield child
+            finally:
+                child.close()
+
+    def close(self) -> None:
+        """Stop the expiry timer (the request is over)."""
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+# No limit: what library code sees when it runs outside of a request
+NO_DEADLINE = Deadline()
+
+_current: contextvars.ContextVar[Deadline] = contextvars.ContextVar("deadline", default=NO_DEADLINE)
+
+
+def current_deadline() -> Deadline:
+    """Deadline of the request running in this context (NO_DEADLINE outside of one)."""
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline) -> Iterator[Deadline]:
+    """Make `deadline` the current one for the calls made in the block."""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
@@ -0,0 +1,206 @@
+import re
+import unicodedata
+import zlib
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Colors are often given in French by retailers and in English by the LLM
+COLOR_SYNONYMS = {
+    "blanc": "white",
+    "blanche": "white",
+    "noir": "black",
+    "noire": "black",
+    "bleu": "blue",
+    "bleue": "blue",
+    "rouge": "red",
+    "vert": "green",
+    "verte": "green",
+    "gris": "grey",
+    "grise": "grey",
+    "gray": "grey",
+    "jaune": "yellow",
+    "rose": "pink",
+    "marron": "brown",
+    "beige": "beige",
+}
+
+# Defaults filled in by ProductSheetAgent._validate_single_product
+PLACEHOLDER_VALUES = {"Unknown", "Various", "Mixed", "clothing"}
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize_tokens(text: str) -> List[str]:
+    """Lowercase, strip accents, glue model numbers ("P-6000" -> "p6000") and map color synonyms."""
+    text = unicodedata.normalize("NFKD", str(text or ""))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    # Hyphens, dots and apostrophes inside a word or model number are not word boundaries
+    text = re.sub(r"(?<=\w)[-./'’](?=\w)", "", text)
+    tokens = re.findall(r"[a-z0-9]+", text)
+    return [COLOR_SYNONYMS.get(token, token) for token in tokens]
+
+
+def product_text(product: Dict[str, Any]) -> str:
+    """Canonical identity string for a product: brand followed by name, brand not repeated."""
+    brand = normalize_tokens(product.get("brand", ""))
+    if " ".join(brand) in {"unknown", ""}:
+        brand = []
+    name = normalize_tokens(product.get("name", ""))
+    name = [token for token in name if token not in brand]
+    return " ".join(brand + name)
+
+
+def model_numbers(product: Dict[str, Any]) -> frozenset:
+    """Tokens with digits (model numbers, sizes) of the product identity string."""
+    return frozenset(token for token in product_text(product).split() if any(c.isdigit() for c in token))
+
+
+def numbers_compatible(a: frozenset, b: frozenset) -> bool:
+    """False when both products carry model numbers and they disagree ("Air Max 90" vs "Air Max 95").
+
+    One side having fewer numbers ("501" vs "501 32") is missing information, not a mismatch.
+    """
+    return not a or not b or a <= b or b <= a
+
+
+def shingles(text: str, k: int = 3) -> List[str]:
+    padded = f" {text} "
+    if len(padded) <= k:
+        return [padded]
+    return [padded[i : i + k] for i in range(len(padded) - k + 1)]
+
+
+class MinHasher:
+    """MinHash signatures over character shingles, computed with NumPy."""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.array(
+            [zlib.crc32(s.encode("utf-8")) for s in set(shingles(text, self.shingle_size))],
+            dtype=np.uint64,
+        )
+        # (a * x + b) mod p over all shingles x permutations at once; uint64 wraps, which is fine for hashing
+        permuted = (np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0)
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.num_perm), dtype=np.uint64)
+        return np.vstack([self.signature(text) for text in texts])
+
+
+def similarity_matrix(signatures: np.ndarray) -> np.ndarray:
+    """Estimated Jaccard similarity between every pair of signatures."""
+    return (signatures[:, None, :] == signatures[None, :, :]).mean(axis=2)
+
+
+def completeness(product: Dict[str, Any]) -> int:
+    """Number of fields carrying real information rather than extraction defaults."""
+    return sum(
+        1
+        for key in ["brand", "color", "size", "material", "type"]
+        if product.get(key) not in PLACEHOLDER_VALUES and product.get(key)
+    )
+
+
+def _representative_key(product: Dict[str, Any]):
+    # Unscored products (matching_score None) rank below every scored one
+    score = product.get("matching_score")
+    return (-1 if score is None else score, completeness(product))
+
+
+def cluster_products(
+    products: List[Dict[str, Any]], threshold: float = 0.7, hasher: Optional[MinHasher] = None
+) -> List[List[int]]:
+    """Group product indices whose identity strings are near-duplicates.
+
+    Products whose model numbers disagree are never grouped, however similar the rest of their names.
+    """
+    hasher = hasher or MinHasher()
+    signatures = hasher.signatures([product_text(p) for p in products])
+    similar = similarity_matrix(signatures) >= threshold
+    numbers = [model_numbers(p) for p in products]
+    for i, j in zip(*np.nonzero(np.triu(similar, k=1))):
+        if not numbers_compatible(numbers[i], numbers[j]):
+            similar[i, j] = similar[j, i] = False
+    return connected_components(similar)
+
+
+def connected_components(similar: np.ndarray) -> List[List[int]]:
+    """Clusters of indices linked by a boolean (n, n) similarity matrix, in first-seen order."""
+    # Union-find over the similar pairs
+    parent = list(range(len(similar)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(*np.nonzero(np.triu(similar, k=1))):
+        parent[find(int(j))] = find(int(i))
+
+    clusters: Dict[int, List[int]] = {}
+    for i in range(len(similar)):
+        clusters.setdefault(find(i), []).append(i)
+    return list(clusters.values())
+
+
+def dedupe_products(
+    products: List[Dict[str, Any]], threshold: float = 0.7
+) -> List[Dict[str, Any]]:
+    """Collapse near-duplicate products, keeping the best-scored / most complete one per cluster.
+
+    The original order of the representatives is preserved.
+    """
+    if len(products) < 2:
+        return list(products)
+
+    keep = []
+    for cluster in cluster_products(products, threshold):
+        best = max(cluster, key=lambda i: _representative_key(products[i]))
+        keep.append(best)
+    return [products[i] for i in sorted(keep)]
+
+
+class NearDuplicateIndex:
+    """Incremental near-duplicate check, used to skip a candidate before it is judged."""
+
+    def __init__(self, threshold: float = 0.7, hasher: Optional[MinHasher] = None):
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher()
+        self.products: List[Dict[str, Any]] = []
+        self._numbers: List[frozenset] = []
+        self._signatures = np.empty((0, self.hasher.num_perm), dtype=np.uint64)
+
+    def find(self, product: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Return the already-indexed product this one duplicates, if any."""
+        if not self.products:
+            return None
+        signature = self.hasher.signature(product_text(product))
+        scores = (self._signatures == signature).mean(axis=1)
+        numbers = model_numbers(product)
+        for i, other in enumerate(self._numbers):
+            if not numbers_compatible(numbers, other):
+                scores[i] = 0.0
+        best = int(scores.argmax())
+        return self.products[best] if scores[best] >= self.threshold else None
+
+    def add(self, product: Dict[str, Any]) -> None:
+        signature = self.hasher.signature(product_text(product))
+        self._signatures = np.vstack([self._signatures, signature])
+        self.products.append(product)
+        self._numbers.append(model_numbers(product))
+
+    def clear(self) -> None:
+        self.products = []
+        self._numbers = []
+        self._signatures = np.empty((0, self.hasher.num_perm), dtype=np.uint64)
@@ -1,38 +1,95 @@
 
-from anthropic_client import client
-import requests
+from deadline import PAGE_LOAD_TIMEOUT, current_deadline, is_deadline_exceeded
+from model_tiers import TokenBudgetExceeded, get_stage_model
+from single_flight import SingleFlight, canonical_url
+
+_image_flight = SingleFlight("IMAGE")
+
+
+def get_image_model():
+    """Rate-limited model of the "image" tier (model_tiers), built on first use."""
+    return get_stage_model("image", temperature=0.1)
+
 def extract_htlm(url):
 
+    import threading
+
     from selenium import webdriver
+    from selenium.common.exceptions import TimeoutException, WebDriverException
     from selenium.webdriver.chrome.options import Options
 
+    deadline = current_deadline()
+    timeout = deadline.timeout(PAGE_LOAD_TIMEOUT)
 
     options = Options()
     options.headless = True
 
     driver = webdriver.Chrome(options=options)
-    driver.get(url)
+    closed = threading.Event()
 
-    html = driver.page_source
+    def close():
+        # Closing the browser aborts a page load still running when the deadline expires
+        if not closed.is_set():
+            closed.set()
+            driver.quit()
 
-    driver.quit()
+    try:
+        driver.set_page_load_timeout(timeout)
+        with deadline.on_cancel(close):
+            try:
+                driver.get(url)
+            except WebDriverException as e:
+                # Cancelled by the deadline: the browser is gone, nothing to read
+                deadline.check(f"loading {url}")
+                if not isinstance(e, TimeoutException):
+                    raise
+                print(f"Page load of {url} timed out after {timeout:.0f}s, using what was loaded")
+            try:
+                html = driver.page_source
+            except WebDriverException:
+                deadline.check(f"reading {url}")
+                raise
+    finally:
+        close()
     return html
 
-def extrate_images(urls):
-    responses = []
-    for url in urls:
-        html = extract_htlm(url)
+def _resolve_image(url):
+    html = extract_htlm(url)
 
-        responses.append(client.generate(
+    try:
+        return get_image_model().generate(
             messages=[
                 {"role": "system", "content":"Only answer with URL link"},
                 {"role": "user", "content": "from this HTML text, find the URL of the image of the product: " + html[:200000]}
-            ]).content)
-        
-    return responses
-
+            ]).content
+    except TokenBudgetExceeded as e:
+        print(f"No image for {url}: {e}")
+        return None
 
 
+def resolve_image(url):
+    """Image URL of one product page; concurrent requests for the same page share one fetch and model call."""
+    return _image_flight.do(canonical_url(url), _resolve_image, url)
 
 
+def extrate_images(urls):
+    # Each distinct page is resolved once, duplicates (up to tracking parameters) reuse its answer
+    deadline = current_deadline()
+    resolved = {}
+    for url in urls:
+        key = canonical_url(url)
+        if key in resolved:
+            continue
+        # Pages not reached before the deadline get no image
+        resolved[key] = None
+        if deadline.expired:
+            deadline.mark_partial()
+            continue
+        try:
+            resolved[key] = resolve_image(url)
+        except Exception as e:
+            if not is_deadline_exceeded(e):
+                raise
+            deadline.mark_partial()
 
+    return [resolved[canonical_url(url)] for url in urls]
@@ -0,0 +1,82 @@
+from typing import List, Optional, Sequence
+
+import numpy as np
+from PIL import Image
+
+from dedup import connected_components
+
+HASH_SIZE = 8
+# pHash is taken from the low frequencies of a (HASH_SIZE * 4)^2 DCT
+PHASH_HIGHFREQ_FACTOR = 4
+# Max differing bits (out of 64) for both hashes to call two images the same photo
+DEFAULT_MAX_DISTANCE = 8
+
+
+def _grayscale(image: Image.Image, size) -> np.ndarray:
+    return np.asarray(image.convert("L").resize(size, Image.LANCZOS), dtype=np.float64)
+
+
+def _pack(bits: np.ndarray) -> np.uint64:
+    return np.packbits(bits.astype(np.uint8).ravel()).view(">u8")[0].astype(np.uint64)
+
+
+def dhash(image: Image.Image, hash_size: int = HASH_SIZE) -> np.uint64:
+    """Difference hash: is each pixel brighter than its right neighbour, on a tiny grayscale copy."""
+    pixels = _grayscale(image, (hash_size + 1, hash_size))
+    return _pack(pixels[:, 1:] > pixels[:, :-1])
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    return np.cos(np.pi * (2 * x + 1) * k / (2 * n))
+
+
+def phash(image: Image.Image, hash_size: int = HASH_SIZE,
+          highfreq_factor: int = PHASH_HIGHFREQ_FACTOR) -> np.uint64:
+    """Perceptual hash: low-frequency DCT coefficients above their median."""
+    size = hash_size * highfreq_factor
+    pixels = _grayscale(image, (size, size))
+    dct = _dct_matrix(size)
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size]
+    return _pack(low > np.median(low))
+
+
+def hamming_matrix(hashes: np.ndarray) -> np.ndarray:
+    """Number of differing bits between every pair of 64-bit hashes."""
+    xor = hashes[:, None] ^ hashes[None, :]
+    return np.unpackbits(xor.view(np.uint8).reshape(*xor.shape, 8), axis=-1).sum(axis=-1)
+
+
+def cluster_images(
+    images: Sequence[Optional[Image.Image]], max_distance: int = DEFAULT_MAX_DISTANCE
+) -> List[List[int]]:
+    """Group indices of near-identical images; missing images (None) stay alone.
+
+    Two images match when both their dHash and pHash differ by at most
+    `max_distance` bits, which holds for the same photo re-encoded or resized
+    by another retailer but not for different shots of a similar product.
+    """
+    present = np.array([image is not None for image in images], dtype=bool)
+    dhashes = np.array([dhash(im) if im is not None else 0 for im in images], dtype=np.uint64)
+    phashes = np.array([phash(im) if im is not None else 0 for im in images], dtype=np.uint64)
+
+    similar = (hamming_matrix(dhashes) <= max_distance) & (hamming_matrix(phashes) <= max_distance)
+    similar &= present[:, None] & present[None, :]
+    return connected_components(similar)
+
+
+def group_offers(
+    images: Sequence[Optional[Image.Image]],
+    prices: Sequence[Optional[float]],
+    max_distance: int = DEFAULT_MAX_DISTANCE,
+) -> List[List[int]]:
+    """Offers showing the same photo, cheapest first within each group.
+
+    Groups keep the order of their first offer, so the gallery order is stable.
+    """
+    def price_key(i):
+        price = prices[i]
+        return (price is None, price if price is not None else 0.0)
+
+    return [sorted(cluster, key=price_key) for cluster in cluster_images(images, max_distance)]
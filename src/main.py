@@ -1,24 +1,8 @@
-import re
 from dotenv import load_dotenv
 import os
-import requests
-from markdownify import markdownify
-from requests.exceptions import RequestException
-from smolagents import (
-    tool,
-    CodeAgent,
-    ToolCallingAgent,
-    WebSearchTool,
-    # ManagedAgent,
-    LiteLLMModel,
-)
-from pydantic import BaseModel, HttpUrl, Field, ValidationError
-
-#from helpers import ask_user
-from agent_conseiller import AgentAdvisor
-from price_searcher import get_prices_from_list_product
-from agent_product_sheet import ProductSheetAgent
-from user_interface import confirm_with_user
+
+# Heavy dependencies (smolagents, litellm, flask, selenium, pydantic) are imported
+# inside main(), at the step that first needs them, to keep cold start fast.
 
 
 def verify_whether_user_likes_product(product_info: str) -> str:
@@ -33,8 +17,14 @@ def verify_whether_user_likes_product(product_info: str) -> str:
     return answer.lower().strip()
 
 
-def main():
-    """Main function to run the fashion agent."""
+def main(resume=None, deadline_seconds=None):
+    """Main function to run the fashion agent.
+
+    Args:
+        resume: Session id to continue from its last completed stage ("last" for the most recent one).
+        deadline_seconds: Latency limit of each recommendation round, from criteria to gallery
+            (FASHION_AGENT_DEADLINE by default, 0 for none).
+    """
 
     # 1. Load environment variables
     if not os.getenv("ANTHROPIC_API_KEY"):
@@ -43,16 +33,36 @@ def main():
     load_dotenv(dotenv_path="fashion_agent/.env")
     api_key = os.getenv("ANTHROPIC_API_KEY")
 
-    # 2. Initialize the LiteLLMModel with the specified model and API key
-    model = LiteLLMModel(model="claude-3-haiku-20240307", api_key=api_key)
+    from model_tiers import get_stage_model, get_usage_tracker
+    from search_providers import get_search
+    from agent_conseiller import AgentAdvisor
+    from agent_product_sheet import ProductSheetAgent
+    from speculative import SpeculativePrefetcher
+    from checkpoint import CheckpointStore
+    from deadline import DEFAULT_DEADLINE, Deadline, deadline_scope
+
+    if deadline_seconds is None:
+        deadline_seconds = DEFAULT_DEADLINE
+
+    # Every stage output is checkpointed, so a failed run resumes without paying again
+    session = CheckpointStore().session(resume)
+    print(f"Session {session.id} (resume with: python main.py --resume {session.id})")
+
+    # 2. Models, max_tokens and token budgets come from the per-stage tiers (model_tiers);
+    # the budgets apply to this request
+    get_usage_tracker().reset()
 
     # 3. Initialize the agents
+    # Product search starts in the background as soon as the dialogue reveals type and style
+    prefetcher = SpeculativePrefetcher(ProductSheetAgent(max_results=5))
+
     advisor_agent = AgentAdvisor(
-        model=model,
+        model=get_stage_model("advisor"),
         api_key=api_key,
+        on_partial_criteria=prefetcher.observe,
     )
 
-    product_sheet_agent = ProductSheetAgent(model=model, max_results=5)
+    product_sheet_agent = ProductSheetAgent(max_results=5, prefetcher=prefetcher)
 
     # User information
     infos = {
@@ -70,45 +80,176 @@ def main():
 
     print("Starting fashion recommendation pipeline...")
 
-    # Pipeline execution
-    max_iterations = 1
-    for iteration in range(max_iterations):
-        # print(f"\n--- Iteration {iteration + 1} ---")
-
-        # Step 1: Get advice from AgentAdvisor
-        print("Step 1: Getting fashion advice...")
-        advisor_prompt = f"""Based on the user information:
-        Name: {infos["name"]}
-        Age: {infos["age"]}
-        Location: {infos["location"]}
-        Size: {infos["size"]}
-        Occasions: {infos["occasions"]}
-        Preferences: {infos["preferences"]}
-        Budget: {infos["budget"]}
-        
-        Provide fashion advice and specific product recommendations that would suit this user.
-        """
-
-        advisor_output = advisor_agent.run_dialogue()
-
-
-        product_sheet_output = product_sheet_agent.generate_product_sheets(advisor_output)
-        print(f"Product sheet: {product_sheet_output}")
-
-        #Step 3: Get prices for the recommended products
+    # Pipeline execution: the first round runs the whole pipeline, later rounds refine
+    # it from the user's feedback and reuse the products, scores and prices computed so far
+    try:
+        max_iterations = 3
+        for iteration in range(max_iterations):
+            print(f"\n--- Iteration {iteration + 1} ---")
+            stage = f"round{iteration + 1}"
+
+            # Criteria of later rounds were checkpointed by the previous round, with the rejected products
+            round_input = session.load(f"{stage}.criteria")
+            if round_input is None:
+                # Step 1: Get advice from AgentAdvisor
+                print("Step 1: Getting fashion advice...")
+                advisor_prompt = f"""Based on the user information:
+                Name: {infos["name"]}
+                Age: {infos["age"]}
+                Location: {infos["location"]}
+                Size: {infos["size"]}
+                Occasions: {infos["occasions"]}
+                Preferences: {infos["preferences"]}
+                Budget: {infos["budget"]}
+            
+                Provide fashion advice and specific product recommendations that would suit this user.
+                """
+
+                criteria = advisor_agent.run_dialogue()
+                round_input = {"criteria": criteria, "raw": advisor_agent.raw_criteria, "rejected": []}
+                session.save(f"{stage}.criteria", round_input)
+            criteria = round_input["criteria"]
+            advisor_agent.raw_criteria = round_input["raw"]
+
+            # Hard latency limit of this recommendation: each stage gets a share of the time
+            # left, outstanding work is cancelled when it runs out, and the stages hand on
+            # the best results found so far
+            deadline = Deadline(deadline_seconds, name=stage)
+            with deadline_scope(deadline):
+                shown_sheets, prices_output, product_urls, image_urls = run_recommendation(
+                    session, stage, iteration, criteria, round_input, product_sheet_agent, deadline
+                )
+            deadline.close()
+
+            if deadline.partial:
+                session.save(f"{stage}.partial", deadline.partial_stages)
+            partial_stages = session.load(f"{stage}.partial", [])
+            if partial_stages:
+                print(f"Partial results: deadline reached during {', '.join(partial_stages)}")
+
+            selection = session.load(f"{stage}.selection")
+            if selection is None:
+                from user_interface import select_products
+
+                urls, feedback = select_products(product_urls, 
+                                  [p['price'] for p in prices_output], 
+                                  [p['name'] for p in prices_output],
+                                  [0 for _ in prices_output],
+                                  image_urls,
+                                  partial=bool(partial_stages))
+                selection = {"urls": urls, "feedback": feedback}
+                session.save(f"{stage}.selection", selection)
+            urls, feedback = selection["urls"], selection["feedback"]
+
+            if urls:
+                break
+
+            # Nothing selected: every product shown is rejected, the feedback updates the criteria
+            # (a resumed session already holds the next round's criteria)
+            next_stage = f"round{iteration + 2}.criteria"
+            if iteration + 1 < max_iterations and session.load(next_stage) is None:
+                if feedback:
+                    criteria = advisor_agent.refine_criteria(feedback)
+                session.save(
+                    next_stage,
+                    {
+                        "criteria": criteria,
+                        "raw": advisor_agent.raw_criteria,
+                        # The sheets, not the priced copies: pricing renames products after the retailer's listing
+                        "rejected": round_input["rejected"] + shown_sheets,
+                    },
+                )
+    finally:
+        # Stop any speculative search the advisor dialogue left running, however the rounds ended
+        prefetcher.close()
+
+    print(get_usage_tracker().report())
+    print(get_search().report())
+
+
+def run_recommendation(session, stage, iteration, criteria, round_input, product_sheet_agent, deadline):
+    """Product sheets, prices and images of one round, each stage under its share of `deadline`.
+
+    Returns (product sheets shown, their priced products, product URLs, image URLs).
+    """
+    checkpoint = session.load(f"{stage}.sheets")
+    if checkpoint is None:
+        with deadline.stage("sheets"):
+            if iteration == 0:
+                product_sheet_output = product_sheet_agent.generate_product_sheets(criteria)
+            else:
+                # Only the criteria delta is searched and judged; rejected products stay out
+                product_sheet_output = product_sheet_agent.refine_product_sheets(
+                    criteria, round_input["rejected"]
+                )
+        checkpoint = {"sheets": product_sheet_output, "agent": product_sheet_agent.get_state()}
+        session.save(f"{stage}.sheets", checkpoint)
+    else:
+        # Resumed: restore what the agent knew after this stage (its own state, with the
+        # pruning counts of this run, is already up to date otherwise)
+        product_sheet_agent.set_state(checkpoint["agent"])
+    product_sheet_output = checkpoint["sheets"]
+    print(f"Product sheet: {product_sheet_output}")
+
+    #Step 3: Get prices for the recommended products
+    # (products priced in an earlier round are fresh hits of the price cache)
+    checkpoint = session.load(f"{stage}.prices")
+    if checkpoint is None:
         print("\nStep 3: Finding prices...")
-        prices_output = get_prices_from_list_product(product_sheet_output)
-        print(f"Price information: {prices_output}")
-
-        #prices_output = [{'name': 'Bulk Unisex T-Shirts Eversoft Cotton Regular Fit', 'price': 36.24, 'url': HttpUrl('https://www.amazon.com/bulk-tshirts-unisex-multiple-sizes/s?k=bulk+tshirts+unisex+multiple+sizes')}]
-
-        print(prices_output)
-
-        urls, feedback = confirm_with_user([str(p['url']) for p in prices_output], 
-                          [p['price'] for p in prices_output], 
-                          [p['name'] for p in prices_output],
-                          [0 for _ in prices_output])
+        from price_searcher import price_products
+
+        with deadline.stage("prices"):
+            priced = price_products(product_sheet_output)
+        print(f"Price information: {[p for p in priced if p is not None]}")
+
+        # Real prices are known now: drop what breaks the budget/brand/material limits
+        # before paying for image extraction and the gallery. The sheets behind the
+        # products kept are the ones the gallery shows (priced copies are renamed
+        # after the retailer's listing)
+        shown = [
+            (sheet, product)
+            for sheet, product in zip(product_sheet_output, priced)
+            if product is not None and product_sheet_agent.constraints.accepts(product, "priced")
+        ]
+        print(product_sheet_agent.constraints.report())
+        checkpoint = {
+            "prices": [product for _, product in shown],
+            "shown_sheets": [sheet for sheet, _ in shown],
+        }
+        session.save(f"{stage}.prices", checkpoint)
+    prices_output = checkpoint["prices"]
+    shown_sheets = checkpoint["shown_sheets"]
+
+    #prices_output = [{'name': 'Bulk Unisex T-Shirts Eversoft Cotton Regular Fit', 'price': 36.24, 'url': HttpUrl('https://www.amazon.com/bulk-tshirts-unisex-multiple-sizes/s?k=bulk+tshirts+unisex+multiple+sizes')}]
+
+    print(prices_output)
+
+    product_urls = [str(p['url']) for p in prices_output]
+    image_urls = session.load(f"{stage}.images")
+    if image_urls is None:
+        from fetch_and_extract_image import extrate_images
+
+        with deadline.stage("images"):
+            image_urls = extrate_images(product_urls)
+        session.save(f"{stage}.images", image_urls)
+
+    return shown_sheets, prices_output, product_urls, image_urls
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fashion recommendation pipeline")
+    parser.add_argument(
+        "--resume",
+        metavar="SESSION",
+        help='continue a checkpointed session from its last completed stage ("last" for the most recent)',
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        metavar="SECONDS",
+        help="latency limit of each recommendation round; partial results are shown when it is reached (0 for none)",
+    )
+    args = parser.parse_args()
+    main(resume=args.resume, deadline_seconds=args.deadline)
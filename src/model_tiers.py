@@ -0,0 +1,243 @@
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class StageTier:
+    """Model, completion cap and per-request token budget of one pipeline stage."""
+
+    def __init__(self, stage: str, model_id: str, max_tokens: int, token_budget: int):
+        self.stage = stage
+        self.model_id = model_id
+        self.max_tokens = max_tokens
+        # 0 means unlimited
+        self.token_budget = token_budget
+
+
+# Cheap fast models on the bulk stages (extraction, judging), the stronger one where
+# a wrong answer costs a retry (structured price offers, image URL in a large page).
+# Each field can be overridden with FASHION_AGENT_<STAGE>_MODEL / _MAX_TOKENS / _TOKEN_BUDGET.
+DEFAULT_TIERS = {
+    "advisor": ("claude-3-haiku-20240307", 256, 60000),
+    "extraction": ("claude-3-haiku-20240307", 1024, 400000),
+    "judge": ("claude-3-haiku-20240307", 16, 60000),
+    "price": ("claude-3-5-haiku-latest", 1024, 200000),
+    "image": ("claude-3-5-haiku-latest", 256, 800000),
+    "default": ("claude-3-5-haiku-latest", 1024, 0),
+}
+
+# USD per million (input, output) tokens, for the cost report
+# Prompt cache reads are billed at 10% of the input price, cache writes at 125%
+CACHE_READ_PRICE = 0.1
+CACHE_WRITE_PRICE = 1.25
+MODEL_PRICES = {
+    "claude-3-haiku-20240307": (0.25, 1.25),
+    "claude-3-5-haiku-latest": (0.80, 4.00),
+    "claude-3-5-haiku-20241022": (0.80, 4.00),
+    "claude-3-5-sonnet-latest": (3.00, 15.00),
+    "claude-3-7-sonnet-latest": (3.00, 15.00),
+    "claude-sonnet-4-20250514": (3.00, 15.00),
+}
+
+
+class TokenBudgetExceeded(RuntimeError):
+    """A stage would go over its per-request token budget."""
+
+
+def is_budget_exceeded(error: BaseException) -> bool:
+    """True if `error` is, or was raised from, a TokenBudgetExceeded (agents wrap model errors)."""
+    while error is not None:
+        if isinstance(error, TokenBudgetExceeded):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def _env(stage: str, field: str) -> Optional[str]:
+    return os.getenv(f"FASHION_AGENT_{stage.upper()}_{field}")
+
+
+def load_tiers() -> Dict[str, StageTier]:
+    tiers = {}
+    for stage, (model_id, max_tokens, token_budget) in DEFAULT_TIERS.items():
+        tiers[stage] = StageTier(
+            stage,
+            _env(stage, "MODEL") or model_id,
+            int(_env(stage, "MAX_TOKENS") or max_tokens),
+            int(_env(stage, "TOKEN_BUDGET") or token_budget),
+        )
+    return tiers
+
+
+_tiers: Optional[Dict[str, StageTier]] = None
+_models: Dict[Tuple[str, Tuple], Any] = {}
+_lock = threading.Lock()
+
+
+def get_tier(stage: str) -> StageTier:
+    global _tiers
+    with _lock:
+        if _tiers is None:
+            _tiers = load_tiers()
+        return _tiers.get(stage) or _tiers["default"]
+
+
+def get_stage_model(stage: str, **kwargs) -> Any:
+    """Rate-limited LiteLLMModel configured for `stage`, built once per stage and options."""
+    tier = get_tier(stage)
+    key = (stage, tuple(sorted(kwargs.items())))
+    with _lock:
+        model = _models.get(key)
+    if model is None:
+        from smolagents import LiteLLMModel
+        from rate_limiter import with_rate_limit
+
+        model = with_rate_limit(
+            LiteLLMModel(
+                model_id=tier.model_id,
+                api_key=os.getenv("ANTHROPIC_API_KEY"),
+                max_tokens=tier.max_tokens,
+                **kwargs,
+            ),
+            stage,
+        )
+        with _lock:
+            model = _models.setdefault(key, model)
+    return model
+
+
+def _cache_tokens(raw: Any) -> Tuple[int, int]:
+    """(cache read, cache write) input tokens of a LiteLLM response, 0 when not reported."""
+    usage = getattr(raw, "usage", None)
+    if usage is None and isinstance(raw, dict):
+        usage = raw.get("usage")
+    if usage is None:
+        return 0, 0
+    if isinstance(usage, dict):
+        get = usage.get
+    else:
+        def get(key, default=None):
+            return getattr(usage, key, default)
+    read = get("cache_read_input_tokens") or 0
+    details = get("prompt_tokens_details")
+    if not read and details is not None:
+        read = (details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", 0)) or 0
+    return int(read), int(get("cache_creation_input_tokens") or 0)
+
+
+def token_usage(response: Any) -> Optional[Tuple[int, int, int, int]]:
+    """(input, output, cache read, cache write) tokens of a smolagents ChatMessage or a Messages API JSON body.
+
+    Input tokens include the cached ones, so budgets count every prompt token.
+    """
+    usage = getattr(response, "token_usage", None)
+    if usage is not None:
+        cache_read, cache_write = _cache_tokens(getattr(response, "raw", None))
+        return usage.input_tokens, usage.output_tokens, cache_read, cache_write
+    if isinstance(response, dict) and isinstance(response.get("usage"), dict):
+        usage = response["usage"]
+        # The Messages API reports cached tokens apart from input_tokens
+        cache_read = usage.get("cache_read_input_tokens") or 0
+        cache_write = usage.get("cache_creation_input_tokens") or 0
+        return (
+            usage.get("input_tokens", 0) + cache_read + cache_write,
+            usage.get("output_tokens", 0),
+            cache_read,
+            cache_write,
+        )
+    return None
+
+
+class UsageTracker:
+    """Tokens, latency and cost per stage for the current request, with budget enforcement."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Start a new request: budgets apply from zero again."""
+        with self._lock:
+            self.calls = defaultdict(int)
+            self.input_tokens = defaultdict(int)
+            self.output_tokens = defaultdict(int)
+            self.cache_read_tokens = defaultdict(int)
+            self.cache_write_tokens = defaultdict(int)
+            self.seconds = defaultdict(float)
+            self.cost = defaultdict(float)
+            self.models: Dict[str, set] = defaultdict(set)
+
+    def used(self, stage: str) -> int:
+        return self.input_tokens[stage] + self.output_tokens[stage]
+
+    def cache_hit_rate(self, stage: str) -> float:
+        """Share of the stage's input tokens served from the prompt cache."""
+        with self._lock:
+            total = self.input_tokens[stage]
+            return self.cache_read_tokens[stage] / total if total else 0.0
+
+    def check(self, stage: str, estimated_tokens: int) -> None:
+        """Raise TokenBudgetExceeded if this call could take `stage` over its budget."""
+        budget = get_tier(stage).token_budget
+        with self._lock:
+            used = self.used(stage)
+        if budget and used + estimated_tokens > budget:
+            raise TokenBudgetExceeded(
+                f"[{stage}] token budget exhausted: {used} used + ~{estimated_tokens} > {budget}"
+            )
+
+    def record(self, stage: str, model_id: Optional[str], input_tokens: int,
+               output_tokens: int, seconds: float, cache_read: int = 0,
+               cache_write: int = 0) -> None:
+        model_id = model_id or get_tier(stage).model_id
+        price_in, price_out = MODEL_PRICES.get(model_id, (0.0, 0.0))
+        uncached = max(input_tokens - cache_read - cache_write, 0)
+        input_cost = price_in * (
+            uncached + cache_read * CACHE_READ_PRICE + cache_write * CACHE_WRITE_PRICE
+        )
+        with self._lock:
+            self.calls[stage] += 1
+            self.input_tokens[stage] += input_tokens
+            self.output_tokens[stage] += output_tokens
+            self.cache_read_tokens[stage] += cache_read
+            self.cache_write_tokens[stage] += cache_write
+            self.seconds[stage] += seconds
+            self.cost[stage] += (input_cost + output_tokens * price_out) / 1e6
+            self.models[stage].add(model_id)
+
+    def report(self) -> str:
+        """One line per stage: model, calls, tokens against budget, cache hits, latency and cost."""
+        with self._lock:
+            stages = list(self.calls)
+            if not stages:
+                return "Model usage: no calls"
+            lines = ["Model usage per stage:"]
+            for stage in stages:
+                budget = get_tier(stage).token_budget
+                calls = self.calls[stage]
+                lines.append(
+                    f"  {stage}: {', '.join(sorted(self.models[stage]))} | {calls} calls | "
+                    f"{self.input_tokens[stage]} in + {self.output_tokens[stage]} out tokens"
+                    + (f" / {budget} budget" if budget else "")
+                    + (
+                        f" | {self.cache_read_tokens[stage] / self.input_tokens[stage]:.0%} cached"
+                        if self.input_tokens[stage] and self.cache_read_tokens[stage]
+                        else ""
+                    )
+                    + f" | {self.seconds[stage] / calls:.2f}s avg, {self.seconds[stage]:.1f}s total"
+                    + f" | ${self.cost[stage]:.4f}"
+                )
+            lines.append(f"  total: ${sum(self.cost.values()):.4f}")
+        return "\n".join(lines)
+
+
+_tracker = UsageTracker()
+
+
+def get_usage_tracker() -> UsageTracker:
+    return _tracker
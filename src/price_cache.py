@@ -0,0 +1,182 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from dotenv import load_dotenv
+
+from dedup import normalize_tokens
+from product_record import ProductRecord
+
+load_dotenv()
+
+DEFAULT_PRICE_CACHE_PATH = os.getenv("FASHION_AGENT_PRICE_CACHE", "price_cache.db")
+# Served as-is while younger than the TTL, served-and-refreshed until max_stale
+DEFAULT_PRICE_TTL = float(os.getenv("FASHION_AGENT_PRICE_TTL_HOURS", 6)) * 3600
+DEFAULT_PRICE_MAX_STALE = float(os.getenv("FASHION_AGENT_PRICE_MAX_STALE_DAYS", 7)) * 24 * 3600
+
+FRESH, STALE, MISSING = "fresh", "stale", "missing"
+
+
+def parse_retailer_ttls(spec: str) -> Dict[str, float]:
+    """Parse "amazon.fr=1,nike.com=24" (hours per retailer domain) into seconds."""
+    ttls = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            domain, hours = item.split("=", 1)
+            try:
+                ttls[domain.strip().lower()] = float(hours) * 3600
+            except ValueError:
+                print(f"Ignoring invalid price TTL: {item}")
+    return ttls
+
+
+def product_key(product) -> str:
+    """Normalized (name, brand, size, color) identity of a product."""
+    return "|".join(
+        " ".join(normalize_tokens(product.get(field, "")))
+        for field in ("name", "brand", "size", "color")
+    )
+
+
+def retailer_of(url: Optional[str]) -> str:
+    host = urlparse(str(url or "")).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class PriceCache:
+    """Persistent stale-while-revalidate cache of price lookups.
+
+    Fresh entries are returned immediately. Stale entries are returned too,
+    while a background thread re-runs the lookup and stores the new price.
+    Entries older than `max_stale` are looked up again synchronously.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_PRICE_CACHE_PATH,
+        ttl: float = DEFAULT_PRICE_TTL,
+        max_stale: float = DEFAULT_PRICE_MAX_STALE,
+        retailer_ttls: Optional[Dict[str, float]] = None,
+        refresh_workers: int = 2,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_stale = max_stale
+        if retailer_ttls is None:
+            retailer_ttls = parse_retailer_ttls(os.getenv("FASHION_AGENT_PRICE_TTLS", ""))
+        self.retailer_ttls = retailer_ttls
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS prices (
+                    key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    retailer TEXT,
+                    fetched_at REAL NOT NULL
+                )
+                """
+            )
+
+        self._refresher = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="price-refresh")
+        self._refreshing = set()
+
+    def ttl_for(self, retailer: str) -> float:
+        """TTL of a retailer domain, matching parent domains (shop.nike.com -> nike.com)."""
+        parts = retailer.split(".")
+        for i in range(len(parts)):
+            ttl = self.retailer_ttls.get(".".join(parts[i:]))
+            if ttl is not None:
+                return ttl
+        return self.ttl
+
+    def get(self, product) -> Tuple[Optional[Dict], str]:
+        """(cached name/price/url, freshness) for a product."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, retailer, fetched_at FROM prices WHERE key = ?",
+                (product_key(product),),
+            ).fetchone()
+        if row is None:
+            return None, MISSING
+
+        payload, retailer, fetched_at = row
+        age = time.time() - fetched_at
+        if age <= self.ttl_for(retailer or ""):
+            return json.loads(payload), FRESH
+        if age <= self.max_stale:
+            return json.loads(payload), STALE
+        return None, MISSING
+
+    def put(self, product, priced: ProductRecord) -> None:
+        """Store the found name, price and url of `priced` under the identity of `product`."""
+        payload = {"name": priced.get("name"), "price": priced.get("price"), "url": priced.get("url")}
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO prices (key, payload, retailer, fetched_at) VALUES (?, ?, ?, ?)",
+                (product_key(product), json.dumps(payload), retailer_of(payload["url"]), time.time()),
+            )
+
+    def lookup(
+        self,
+        product: ProductRecord,
+        fetch: Callable[[ProductRecord], Optional[ProductRecord]],
+    ) -> Optional[ProductRecord]:
+        """Priced copy of `product`, from cache when possible, otherwise from `fetch(product)`."""
+        cached = self.cached(product, fetch)
+        if cached is not None:
+            return cached
+
+        priced = fetch(product)
+        if priced is not None:
+            self.put(product, priced)
+        return priced
+
+    def cached(
+        self,
+        product: ProductRecord,
+        refresh: Callable[[ProductRecord], Optional[ProductRecord]],
+    ) -> Optional[ProductRecord]:
+        """Priced copy of `product` if cached (stale entries get `refresh`ed in background), else None."""
+        cached, state = self.get(product)
+        if state == FRESH:
+            print(f"--- CACHE: fresh price for {product['name']} ---")
+            return product.copy(**cached)
+        if state == STALE:
+            print(f"--- CACHE: stale price for {product['name']}, refreshing in background ---")
+            self._refresh_in_background(product, refresh)
+            return product.copy(**cached)
+        return None
+
+    def _refresh_in_background(self, product: ProductRecord, fetch) -> None:
+        key = product_key(product)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                priced = fetch(product)
+                if priced is not None:
+                    self.put(product, priced)
+            except Exception as e:
+                print(f"--- CACHE: background refresh failed for {product['name']}: {e} ---")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresher.submit(refresh)
+
+    def close(self, wait: bool = True) -> None:
+        """Let pending background refreshes finish, then close the database."""
+        self._refresher.shutdown(wait=wait)
+        with self._lock:
+            self._conn.close()
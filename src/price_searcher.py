@@ -1,4 +1,6 @@
 import os
+import re
+import json
 import asyncio
 from typing import Type, List, Dict, Any
 from dotenv import load_dotenv
@@ -6,7 +8,15 @@ from dotenv import load_dotenv
 from pydantic import BaseModel, HttpUrl, Field, ValidationError
 
 # Using the corrected import paths
-from smolagents import CodeAgent, LiteLLMModel, WebSearchTool, tool, Tool
+from smolagents import CodeAgent, LiteLLMModel, tool, Tool
+
+from deadline import DeadlineExceeded, current_deadline, is_deadline_exceeded
+from dedup import normalize_tokens
+from price_cache import PriceCache, product_key
+from product_record import ProductRecord, as_record
+from model_tiers import get_stage_model, is_budget_exceeded
+from search_providers import SearchTool, search_text
+from single_flight import SingleFlight
 
 # --- 1. Pydantic Data Class Definitions (Data Contracts) ---
 
@@ -79,49 +89,361 @@ def create_pydantic_validator_tool(model_class: Type[BaseModel]) -> Tool:
 # --- 3. The Orchestrator Tool ---
 # Defined as a standalone  function, as you requested.
 
+# One web search + one structured model call per product; the agent is the fallback
+PRICE_DIRECT_MODE = os.getenv("FASHION_AGENT_PRICE_DIRECT", "1") != "0"
 
-@tool
-def get_prices_from_list_product(products_to_find: list[dict]) -> list[dict]:
-    """A tool that takes a list of dict (ProductNew) and finds the best price for each one.
+# Largest number of same-brand products priced by one batched model call
+MAX_PRICE_GROUP = int(os.getenv("FASHION_AGENT_PRICE_GROUP", 8))
 
-    Args:
-        products_to_find: A list of dictionaries representing products to search for. Each dictionary must conform to the ProductNew schema (name, brand, size, color).
+_price_cache = None
+_price_flight = SingleFlight("PRICE")
 
-    Returns:
-        A list of dictionaries, each containing the found product details.
-    """
-    print("products_to_find:", products_to_find)
-    print(f"--- TOOL: Starting  search for {len(products_to_find)} products... ---")
 
+def get_price_cache() -> PriceCache:
+    """The persistent price cache, opened on first use."""
+    global _price_cache
+    if _price_cache is None:
+        _price_cache = PriceCache()
+    return _price_cache
+
+
+def _price_model():
+    # Model, max_tokens and token budget of the "price" tier (model_tiers)
+    return get_stage_model("price", temperature=0.0)
+
+
+def _build_worker_agent() -> CodeAgent:
+    """A fresh "worker" agent; one per lookup so background refreshes never share agent memory."""
     product_validator_tool = create_pydantic_validator_tool(ProductPriceInfo)
+    return CodeAgent(
+        model=_price_model(), tools=[SearchTool(), product_validator_tool]
+    )
+
 
-    # Configure the "worker" agent that will be used for each sub-task.
-    # Using the specified model as requested.
-    claude_model = LiteLLMModel(model_id="claude-3-5-haiku-latest", temperature=0.0)
-    worker_agent = CodeAgent(
-        model=claude_model, tools=[WebSearchTool(), product_validator_tool]
+def _product_query(product: ProductRecord) -> str:
+    parts = [product.get("brand"), product["name"], product.get("color"), "price"]
+    return " ".join(str(p) for p in parts if p and p not in ("Unknown", "Various"))
+
+
+def _parse_json_answer(text: str, model_class: Type[BaseModel] = ProductPriceInfo) -> BaseModel:
+    """Validate a model answer locally, tolerating code fences or text around the JSON."""
+    match = re.search(r"\{.*\}", text or "", re.DOTALL)
+    if not match:
+        raise ValueError(f"No JSON object in answer: {text!r}")
+    return model_class.model_validate_json(match.group(0))
+
+
+def search_product_price_direct(product: ProductRecord) -> ProductRecord | None:
+    """One web search and one structured-output model call, validated against ProductPriceInfo."""
+    query = _product_query(product)
+    try:
+        search_results = search_text(query)
+    except Exception as e:
+        print(f"--- TOOL: Search failed for {product['name']}: {e} ---")
+        return None
+
+    messages = [
+        {
+            "role": "system",
+            "content": "You extract product offers from web search results. Answer with a single JSON object only.",
+        },
+        {
+            "role": "user",
+            "content": (
+                f"Product: {product['name']} in {product['color'] or 'any color'}, size {product['size']}.\n"
+                "From the search results below, find the best price for this product in euros and the "
+                "direct purchase URL, and reuse the product name given.\n"
+                f"Answer with JSON matching this schema: {json.dumps(ProductPriceInfo.model_json_schema())}\n"
+                "If no result offers this product with a price, answer {}.\n\n"
+                f"Search results:\n{search_results}"
+            ),
+        },
+    ]
+    response = _price_model().generate(
+        messages,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {
+                "name": ProductPriceInfo.__name__,
+                "schema": ProductPriceInfo.model_json_schema(),
+            },
+        },
+    )
+    try:
+        price_info = _parse_json_answer(response.content)
+    except (ValidationError, ValueError) as e:
+        print(f"--- TOOL: Direct lookup failed for {product['name']}, falling back to agent: {e} ---")
+        return None
+    return product.copy(
+        name=price_info.name, price=price_info.price, url=str(price_info.url)
     )
 
-    # use result = code_agent.run(prompt)
-    results = []
-    for product in products_to_find:
-        print(f"--- TOOL: Processing product: {product['name']} ---")
 
-        # Create a prompt for the worker agent
-        prompt = f"""
+def search_product_price_agent(product: ProductRecord) -> ProductRecord | None:
+    """Run the multi-step worker agent for one product, returning it completed with name, price and url."""
+    worker_agent = _build_worker_agent()
+    validator_name = f"validate_{ProductPriceInfo.__name__}_tool"
+
+    # Create a prompt for the worker agent
+    prompt = f"""
         You are an expert shopping assistant.
 
         1.  **Search**: Use the 'web_search' tool to find a {product["name"]} in {product["color"] or "any color"}, size {product["size"]}.
         2.  **Extract Information**: From the results, find the best price for the product, add the direct purchase URL, and reuse the product name given.
-        3.  **Validate Your Findings**: Use the '{product_validator_tool.name}' tool to validate the data you extracted.
+        3.  **Validate Your Findings**: Use the '{validator_name}' tool to validate the data you extracted.
         4.  **Final Answer**: Once the validation tool succeeds, its output is your final answer. Provide only that output.
 
         Begin.
         """
-        result = worker_agent.run(prompt)
-        results.append(result)
+    deadline = current_deadline()
+    deadline.check(f"pricing {product['name']}")
+    # The agent stops at its next step once the deadline expires
+    with deadline.on_cancel(worker_agent.interrupt):
+        try:
+            result = worker_agent.run(prompt)
+        except Exception as e:
+            if deadline.expired:
+                raise DeadlineExceeded(f"price lookup of {product['name']} interrupted") from e
+            raise
+    if not isinstance(result, dict):
+        print(f"--- TOOL: No price found for {product['name']}: {result} ---")
+        return None
+    try:
+        price_info = ProductPriceInfo(**result)
+    except ValidationError as e:
+        print(f"--- TOOL: Invalid price info for {product['name']}: {e} ---")
+        return None
+    return product.copy(
+        name=price_info.name, price=price_info.price, url=str(price_info.url)
+    )
+
 
-    return [result for result in results if result is not None]
+def _search_product_price(product: ProductRecord) -> ProductRecord | None:
+    """Price one product: direct one-call lookup first, the multi-step agent only if it fails."""
+    print(f"--- TOOL: Processing product: {product['name']} ---")
+    priced = None
+    if PRICE_DIRECT_MODE:
+        try:
+            priced = search_product_price_direct(product)
+        except Exception as e:
+            print(f"--- TOOL: Direct lookup error for {product['name']}: {e} ---")
+            if is_deadline_exceeded(e):
+                raise
+            if is_budget_exceeded(e):
+                return None
+    if priced is None:
+        try:
+            priced = search_product_price_agent(product)
+        except Exception as e:
+            if not is_budget_exceeded(e):
+                raise
+            print(f"--- TOOL: Price token budget exhausted, {product['name']} left unpriced ---")
+    return priced
+
+
+def _offer_of(priced: ProductRecord) -> Dict[str, Any]:
+    return {"name": priced.get("name"), "price": priced.get("price"), "url": priced.get("url")}
+
+
+def search_product_price(product: ProductRecord) -> ProductRecord | None:
+    """Price one product; concurrent lookups of the same product identity share one search."""
+    return _price_flight.do(product_key(product), _search_product_price, product)
+
+
+class GroupOffers(BaseModel):
+    """Batched answer: one offer (or null) per product id of the group."""
+
+    offers: Dict[int, ProductPriceInfo | None]
+
+
+def group_products(products: List[ProductRecord], max_group_size: int = MAX_PRICE_GROUP) -> List[List[int]]:
+    """Indices of products sharing a brand (or, without brand, a type), in groups of at most max_group_size."""
+    groups: Dict[str, List[int]] = {}
+    for i, product in enumerate(products):
+        brand = " ".join(normalize_tokens(product.get("brand", "")))
+        if brand in ("", "unknown"):
+            brand = "type:" + " ".join(normalize_tokens(product.get("type", "")))
+        groups.setdefault(brand, []).append(i)
+
+    chunks = []
+    for indices in groups.values():
+        for start in range(0, len(indices), max_group_size):
+            chunks.append(indices[start : start + max_group_size])
+    return chunks
+
+
+def _group_query(products: List[ProductRecord]) -> str:
+    """One shared search for a group: common brand plus the distinctive name words."""
+    words, seen = [], set()
+    for product in products:
+        for word in str(product["name"]).split():
+            if word.lower() not in seen:
+                seen.add(word.lower())
+                words.append(word)
+    brand = products[0].get("brand")
+    prefix = [brand] if brand and brand != "Unknown" else []
+    return " ".join(prefix + words[:12] + ["price"])
+
+
+def search_group_prices(products: List[ProductRecord]) -> List[ProductRecord | None]:
+    """One shared web search and one model call pricing a whole group; None where unresolved."""
+    query = _group_query(products)
+    try:
+        search_results = search_text(query)
+    except Exception as e:
+        if is_deadline_exceeded(e):
+            raise
+        print(f"--- TOOL: Group search failed ({query}): {e} ---")
+        return [None] * len(products)
+
+    listing = "\n".join(
+        f"{i}: {p['name']} by {p.get('brand', 'any brand')} in {p['color'] or 'any color'}, size {p['size']}"
+        for i, p in enumerate(products)
+    )
+    messages = [
+        {
+            "role": "system",
+            "content": "You extract product offers from web search results. Answer with a single JSON object only.",
+        },
+        {
+            "role": "user",
+            "content": (
+                f"Products:\n{listing}\n\n"
+                "For each product id, find in the search results below the best price in euros and the "
+                "direct purchase URL, and reuse the product name given. Use null for a product that "
+                "the results do not offer.\n"
+                f"Answer with JSON matching this schema: {json.dumps(GroupOffers.model_json_schema())}\n\n"
+                f"Search results:\n{search_results}"
+            ),
+        },
+    ]
+    try:
+        response = _price_model().generate(messages)
+        offers = _parse_json_answer(response.content, GroupOffers).offers
+    except Exception as e:
+        # Any failure (invalid answer, budget, provider or model error) leaves the
+        # group to the per-product lookups; only deadline expiry stops pricing
+        if is_deadline_exceeded(e):
+            raise
+        print(f"--- TOOL: Group lookup failed ({query}): {type(e).__name__}: {e} ---")
+        return [None] * len(products)
+
+    results = []
+    for i, product in enumerate(products):
+        offer = offers.get(i)
+        results.append(
+            product.copy(name=offer.name, price=offer.price, url=str(offer.url))
+            if offer is not None
+            else None
+        )
+    return results
+
+
+def search_product_prices(products: List[ProductRecord]) -> List[ProductRecord | None]:
+    """Price many products, batching those of the same brand; unresolved ones are looked up alone.
+
+    Products not priced when the request deadline expires stay None.
+    """
+    deadline = current_deadline()
+    priced: List[ProductRecord | None] = [None] * len(products)
+    try:
+        for indices in group_products(products):
+            deadline.check("the next price lookup")
+            group = [products[i] for i in indices]
+            if len(group) > 1:
+                print(f"--- TOOL: Batched lookup for {len(group)} products ---")
+                for i, result in zip(indices, search_group_prices(group)):
+                    priced[i] = result
+            for i in indices:
+                if priced[i] is None:
+                    # Not the single-flight wrapper: the caller already leads these keys
+                    try:
+                        priced[i] = _search_product_price(products[i])
+                    except Exception as e:
+                        if is_deadline_exceeded(e):
+                            raise
+                        print(f"--- TOOL: Price lookup failed for {products[i]['name']}: {e} ---")
+    except Exception as e:
+        if not is_deadline_exceeded(e):
+            raise
+        deadline.mark_partial()
+    return priced
+
+
+@tool
+def get_prices_from_list_product(products_to_find: list[dict]) -> list[dict]:
+    """A tool that takes a list of products (ProductNew dicts or ProductRecord) and finds the best price for each one.
+
+    Prices found earlier are served from the persistent price cache; stale ones are
+    refreshed in the background. The rest are looked up in batches of products sharing
+    a brand, with single-product lookups for whatever a batch cannot resolve.
+    Products still unpriced when the request deadline expires are left out.
+
+    Args:
+        products_to_find: A list of products to search for. Each must provide the ProductNew fields (name, brand, size, color).
+
+    Returns:
+        A list of ProductRecord, the input products completed with the found name, price and url.
+    """
+    return [result for result in price_products(products_to_find) if result is not None]
+
+
+def price_products(products_to_find: List[Any]) -> List[ProductRecord | None]:
+    """get_prices_from_list_product aligned with its input: None for each product left unpriced.
+
+    The priced copies carry the retailer's listing name, so callers that need to know
+    which input product a result came from zip the two lists.
+    """
+    print("products_to_find:", products_to_find)
+    print(f"--- TOOL: Starting  search for {len(products_to_find)} products... ---")
+    deadline = current_deadline()
+
+    price_cache = get_price_cache()
+    products = [as_record(product) for product in products_to_find]
+    results: List[ProductRecord | None] = [
+        price_cache.cached(product, search_product_price) for product in products
+    ]
+
+    # Each missing product identity is looked up once, even if listed several times or
+    # already being looked up by another session (then its result is awaited instead)
+    calls, leading = {}, []
+    for i, result in enumerate(results):
+        key = product_key(products[i])
+        if result is not None or key in calls:
+            continue
+        calls[key], leader = _price_flight.begin(key)
+        if leader:
+            leading.append(i)
+
+    try:
+        found = search_product_prices([products[i] for i in leading])
+    except BaseException as e:
+        for i in leading:
+            key = product_key(products[i])
+            _price_flight.finish(key, calls[key], error=e)
+        raise
+    for i, priced in zip(leading, found):
+        key = product_key(products[i])
+        _price_flight.finish(key, calls[key], result=priced)
+    for i, priced in zip(leading, found):
+        if priced is not None:
+            price_cache.put(products[i], priced)
+
+    for i, result in enumerate(results):
+        if result is None:
+            try:
+                # Lookups led by another session are awaited only until the deadline
+                priced = calls[product_key(products[i])].wait(timeout=deadline.remaining())
+            except TimeoutError:
+                deadline.mark_partial()
+                priced = None
+            except Exception as e:
+                print(f"--- TOOL: Shared lookup failed for {products[i]['name']}: {e} ---")
+                priced = None
+            # Keep this product's own fields, take the found name, price and url
+            results[i] = products[i].copy(**_offer_of(priced)) if priced is not None else None
+
+    return results
 
 
 # --- 4. Example Usage: A "Manager Agent" Using the Tool ---
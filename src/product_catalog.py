@@ -0,0 +1,182 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from constraints import parse_amount
+from product_record import ProductRecord
+
+load_dotenv()
+
+DEFAULT_CATALOG_PATH = os.getenv("FASHION_AGENT_CATALOG", "product_catalog.db")
+DEFAULT_MAX_AGE = float(os.getenv("FASHION_AGENT_CATALOG_MAX_AGE_DAYS", 7)) * 24 * 3600
+
+PRODUCT_FIELDS = ["name", "brand", "color", "size", "price", "material", "type"]
+TEXT_FIELDS = ["name", "brand", "material", "color", "type"]
+
+
+def _normalize(value: Any) -> str:
+    return re.sub(r"\s+", " ", str(value or "")).strip().lower()
+
+
+def _fts_term(text: str) -> Optional[str]:
+    """Quote a free-text term for an FTS5 MATCH expression."""
+    words = re.findall(r"\w+", str(text or "").lower())
+    if not words:
+        return None
+    return '"' + " ".join(words) + '"'
+
+
+class ProductCatalog:
+    """Local SQLite catalog of every product extracted so far.
+
+    Products are upserted by normalized (name, brand) and indexed with FTS5 on
+    name, brand, material, color and type, so the product sheet agent can serve
+    popular criteria from disk before paying for web search and extraction.
+    """
+
+    def __init__(self, path: str = DEFAULT_CATALOG_PATH, max_age: float = DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        with self._lock, self._conn:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS products (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    brand TEXT,
+                    color TEXT,
+                    size TEXT,
+                    price REAL,
+                    material TEXT,
+                    type TEXT,
+                    name_key TEXT NOT NULL,
+                    brand_key TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    UNIQUE (name_key, brand_key)
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+                    name, brand, material, color, type,
+                    content='products', content_rowid='id'
+                );
+                CREATE TRIGGER IF NOT EXISTS products_ai AFTER INSERT ON products BEGIN
+                    INSERT INTO products_fts(rowid, name, brand, material, color, type)
+                    VALUES (new.id, new.name, new.brand, new.material, new.color, new.type);
+                END;
+                CREATE TRIGGER IF NOT EXISTS products_ad AFTER DELETE ON products BEGIN
+                    INSERT INTO products_fts(products_fts, rowid, name, brand, material, color, type)
+                    VALUES ('delete', old.id, old.name, old.brand, old.material, old.color, old.type);
+                END;
+                CREATE TRIGGER IF NOT EXISTS products_au AFTER UPDATE ON products BEGIN
+                    INSERT INTO products_fts(products_fts, rowid, name, brand, material, color, type)
+                    VALUES ('delete', old.id, old.name, old.brand, old.material, old.color, old.type);
+                    INSERT INTO products_fts(rowid, name, brand, material, color, type)
+                    VALUES (new.id, new.name, new.brand, new.material, new.color, new.type);
+                END;
+                """
+            )
+
+    def upsert(self, product: ProductRecord) -> None:
+        """Insert a validated product, or refresh it if (name, brand) is already known."""
+        if not product or not product.get("name"):
+            return
+        values = {field: product.get(field) for field in PRODUCT_FIELDS}
+        values["size"] = str(values["size"]) if values["size"] is not None else None
+        values["name_key"] = _normalize(product.get("name"))
+        values["brand_key"] = _normalize(product.get("brand"))
+        values["updated_at"] = time.time()
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                INSERT INTO products (name, brand, color, size, price, material, type,
+                                      name_key, brand_key, updated_at)
+                VALUES (:name, :brand, :color, :size, :price, :material, :type,
+                        :name_key, :brand_key, :updated_at)
+                ON CONFLICT (name_key, brand_key) DO UPDATE SET
+                    name = excluded.name, color = excluded.color, size = excluded.size,
+                    price = excluded.price, material = excluded.material,
+                    type = excluded.type, updated_at = excluded.updated_at
+                """,
+                values,
+            )
+
+    def _build_match(self, criteria: Dict[str, Any]) -> Optional[str]:
+        """FTS5 expression: the product type must match, any other criterion ranks higher."""
+        type_term = _fts_term(criteria.get("type"))
+        if not type_term:
+            return None
+
+        optional_terms = []
+        for key in ["colors", "materials", "brands"]:
+            for value in criteria.get(key, []) or []:
+                term = _fts_term(value)
+                if term:
+                    optional_terms.append(term)
+        for style in str(criteria.get("style", "")).split(","):
+            term = _fts_term(style)
+            if term:
+                optional_terms.append(term)
+
+        match = f"{{name type}} : {type_term}"
+        if optional_terms:
+            # OR-ing an always-true clause keeps the optional terms as ranking signal only
+            match = f"({match}) AND ({type_term} OR {' OR '.join(optional_terms)})"
+        return match
+
+    def search(self, criteria: Dict[str, Any], limit: int = 5) -> List[ProductRecord]:
+        """Fresh catalog products matching validated criteria, best FTS match first."""
+        match = self._build_match(criteria)
+        if not match:
+            return []
+
+        # Budgets may be text ("40 euro"): SQLite sorts every REAL below TEXT, so bind numbers
+        # only, and leave out a bound that does not parse
+        budget_min = parse_amount(criteria.get("budget_min"))
+        budget_max = parse_amount(criteria.get("budget_max"))
+        if budget_min is not None and budget_max is not None and budget_min > budget_max:
+            budget_min, budget_max = budget_max, budget_min
+        budget_sql, budget_params = "", []
+        if budget_min:
+            budget_sql += " AND (p.price IS NULL OR p.price >= ?)"
+            budget_params.append(budget_min)
+        if budget_max is not None and budget_max != float("inf"):
+            budget_sql += " AND (p.price IS NULL OR p.price <= ?)"
+            budget_params.append(budget_max)
+
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"""
+                    SELECT p.* FROM products_fts
+                    JOIN products p ON p.id = products_fts.rowid
+                    WHERE products_fts MATCH ?
+                      AND p.updated_at >= ?{budget_sql}
+                    ORDER BY bm25(products_fts)
+                    LIMIT ?
+                    """,
+                    (match, time.time() - self.max_age, *budget_params, limit),
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Catalog search error: {e}")
+            return []
+
+        return [ProductRecord(**{field: row[field] for field in PRODUCT_FIELDS}) for row in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,247 @@
+import json
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+PRODUCT_FIELDS = (
+    "name",
+    "brand",
+    "color",
+    "size",
+    "price",
+    "material",
+    "type",
+    "matching_score",
+    "url",
+    "image_url",
+    "env_score",
+)
+NUMERIC_FIELDS = ("price", "matching_score", "env_score")
+
+# What a product sheet handed to the price searcher contains
+SHEET_FIELDS = ("brand", "size", "name", "color")
+
+
+class ProductRecord:
+    """One product as it moves through extraction, scoring, pricing and display.
+
+    Fields that are not known yet are None. The record also answers the small
+    part of the dict protocol the pipeline relies on (`get`, `[]`, `in`), so code
+    written against the old product dicts keeps working unchanged.
+    """
+
+    __slots__ = PRODUCT_FIELDS
+
+    def __init__(
+        self,
+        name: str,
+        brand: Optional[str] = None,
+        color: Optional[str] = None,
+        size: Any = None,
+        price: Optional[float] = None,
+        material: Optional[str] = None,
+        type: Optional[str] = None,
+        matching_score: Optional[int] = None,
+        url: Optional[str] = None,
+        image_url: Optional[str] = None,
+        env_score: Optional[float] = None,
+    ):
+        self.name = name
+        self.brand = brand
+        self.color = color
+        self.size = size
+        self.price = price
+        self.material = material
+        self.type = type
+        self.matching_score = matching_score
+        self.url = url
+        self.image_url = image_url
+        self.env_score = env_score
+
+    # --- dict compatibility ---
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = getattr(self, key, None) if key in PRODUCT_FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in PRODUCT_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in PRODUCT_FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        return key in PRODUCT_FIELDS and getattr(self, key) is not None
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, ProductRecord):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in PRODUCT_FIELDS)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{k}={v!r}" for k, v in self.to_dict().items())
+        return f"ProductRecord({fields})"
+
+    # --- conversion ---
+
+    @classmethod
+    def from_dict(cls, data: Union["ProductRecord", Dict[str, Any]]) -> "ProductRecord":
+        """Build a record from a product dict (unknown keys are ignored)."""
+        if isinstance(data, ProductRecord):
+            return data
+        return cls(**{k: data[k] for k in PRODUCT_FIELDS if k in data})
+
+    def to_dict(self, fields: Iterable[str] = PRODUCT_FIELDS) -> Dict[str, Any]:
+        """Known fields only, in field order."""
+        return {f: getattr(self, f) for f in fields if getattr(self, f) is not None}
+
+    def to_prompt(self) -> str:
+        """Compact one-line description for LLM prompts (cheaper than str(dict))."""
+        return "; ".join(
+            f"{f}: {getattr(self, f)}"
+            for f in ("name", "brand", "type", "color", "material", "size", "price")
+            if getattr(self, f) is not None
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), separators=(",", ":"), default=str)
+
+    @classmethod
+    def from_json(cls, payload: str) -> "ProductRecord":
+        return cls.from_dict(json.loads(payload))
+
+    def to_msgpack(self) -> bytes:
+        import msgpack
+
+        # Positional array: no field names on the wire
+        return msgpack.packb([_plain(getattr(self, f)) for f in PRODUCT_FIELDS])
+
+    @classmethod
+    def from_msgpack(cls, payload: bytes) -> "ProductRecord":
+        import msgpack
+
+        return cls(*msgpack.unpackb(payload))
+
+    def copy(self, **changes: Any) -> "ProductRecord":
+        record = ProductRecord(*(getattr(self, f) for f in PRODUCT_FIELDS))
+        for key, value in changes.items():
+            record[key] = value
+        return record
+
+
+def as_record(product: Union[ProductRecord, Dict[str, Any]]) -> ProductRecord:
+    """Accept either a record or a legacy product dict."""
+    return ProductRecord.from_dict(product)
+
+
+def _plain(value: Any) -> Any:
+    """Make a value msgpack/JSON-friendly (pydantic URLs, numpy scalars, NaN)."""
+    if value is None or isinstance(value, (str, bool, int)):
+        return value
+    if isinstance(value, (float, np.floating)):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return str(value)
+
+
+class ProductBatch:
+    """Columnar container for a whole candidate set.
+
+    Numeric fields are float arrays (NaN = unknown) and text fields object
+    arrays, so filtering and sorting thousands of candidates is one vectorized
+    operation instead of a Python loop over dicts.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns = columns
+
+    @classmethod
+    def from_records(cls, products: Iterable[Union[ProductRecord, Dict[str, Any]]]) -> "ProductBatch":
+        records = [as_record(p) for p in products]
+        columns = {}
+        for field in PRODUCT_FIELDS:
+            values = [getattr(r, field) for r in records]
+            if field in NUMERIC_FIELDS:
+                columns[field] = np.array(
+                    [np.nan if v is None else float(v) for v in values], dtype=float
+                )
+            else:
+                column = np.empty(len(values), dtype=object)
+                column[:] = values
+                columns[field] = column
+        return cls(columns)
+
+    def __len__(self) -> int:
+        return len(self.columns["name"])
+
+    def column(self, field: str) -> np.ndarray:
+        return self.columns[field]
+
+    def take(self, indices: np.ndarray) -> "ProductBatch":
+        """New batch with the rows selected by a boolean mask or index array."""
+        return ProductBatch({f: col[indices] for f, col in self.columns.items()})
+
+    def filter(self, mask: Union[np.ndarray, Callable[["ProductBatch"], np.ndarray]]) -> "ProductBatch":
+        if callable(mask):
+            mask = mask(self)
+        return self.take(np.asarray(mask, dtype=bool))
+
+    def sort_by(self, field: str, reverse: bool = False) -> "ProductBatch":
+        """Stable sort on one column; unknown (NaN/None) values always go last."""
+        column = self.columns[field]
+        if field in NUMERIC_FIELDS:
+            keys = -column if reverse else column
+            order = np.argsort(np.where(np.isnan(keys), np.inf, keys), kind="stable")
+        else:
+            known = [i for i in range(len(column)) if column[i] is not None]
+            known.sort(key=lambda i: str(column[i]), reverse=reverse)
+            missing = [i for i in range(len(column)) if column[i] is None]
+            order = np.array(known + missing, dtype=int)
+        return self.take(order)
+
+    def head(self, n: int) -> "ProductBatch":
+        return self.take(np.arange(min(n, len(self))))
+
+    def records(self) -> List[ProductRecord]:
+        records = []
+        for i in range(len(self)):
+            record = ProductRecord(*(_plain(self.columns[f][i]) for f in PRODUCT_FIELDS))
+            if record.matching_score is not None:
+                record.matching_score = int(record.matching_score)
+            records.append(record)
+        return records
+
+    def to_dict(self) -> Dict[str, List[Any]]:
+        return {f: [_plain(v) for v in col] for f, col in self.columns.items()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, List[Any]]) -> "ProductBatch":
+        length = len(data.get("name", []))
+        rows = [
+            ProductRecord(*(data.get(f, [None] * length)[i] for f in PRODUCT_FIELDS))
+            for i in range(length)
+        ]
+        return cls.from_records(rows)
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, payload: str) -> "ProductBatch":
+        return cls.from_dict(json.loads(payload))
+
+    def to_msgpack(self) -> bytes:
+        import msgpack
+
+        return msgpack.packb(self.to_dict())
+
+    @classmethod
+    def from_msgpack(cls, payload: bytes) -> "ProductBatch":
+        import msgpack
+
+        return cls.from_dict(msgpack.unpackb(payload))
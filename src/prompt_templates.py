@@ -0,0 +1,106 @@
+import json
+import math
+from string import Template
+from typing import Any, Dict, List
+
+# Anthropic prompt caching marker; everything up to and including the marked block is cached.
+# The provider only caches prefixes above a minimum length (1024 tokens on most models),
+# shorter prefixes are sent normally.
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def canonical_criteria(criteria: Dict[str, Any]) -> str:
+    """Compact, stable JSON of validated criteria: sorted keys, empty and unbounded values left out.
+
+    The same criteria always give the same bytes, so prompts built on them share a cacheable prefix.
+    """
+    compact = {}
+    for key in sorted(criteria):
+        value = criteria[key]
+        if value is None or value == "" or value == []:
+            continue
+        if isinstance(value, float) and math.isinf(value):
+            continue
+        compact[key] = value
+    return json.dumps(compact, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def mark_cached(content: Any) -> List[Dict[str, Any]]:
+    """Content blocks of a message with the last one marked for prompt caching."""
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    blocks = [dict(block) for block in content]
+    if blocks:
+        blocks[-1]["cache_control"] = CACHE_CONTROL
+    return blocks
+
+
+class PromptTemplate:
+    """A prompt compiled once into a static prefix and a per-call suffix.
+
+    `bind` renders the prefix (instructions plus session context such as the
+    criteria) a single time; each call then only renders the short suffix. The
+    prefix is sent as its own content block marked for prompt caching.
+    """
+
+    def __init__(self, prefix: str, suffix: str):
+        self.prefix = Template(prefix)
+        self.suffix = Template(suffix)
+
+    def bind(self, **context: Any) -> "BoundPrompt":
+        return BoundPrompt(self.prefix.substitute(context), self.suffix)
+
+
+class BoundPrompt:
+    def __init__(self, prefix: str, suffix: Template):
+        self.prefix_block = mark_cached(prefix)[0]
+        self.suffix = suffix
+
+    def messages(self, **values: Any) -> List[Dict[str, Any]]:
+        return [
+            {
+                "role": "user",
+                "content": [
+                    self.prefix_block,
+                    {"type": "text", "text": self.suffix.substitute(values)},
+                ],
+            }
+        ]
+
+
+JUDGE_PROMPT = PromptTemplate(
+    prefix="""Score products 0-100 based on the criteria.
+Criteria: $criteria
+
+Consider:
+- How well the product matches the style, season, and occasion
+- Material compatibility with criteria
+- Color match with preferences
+- Overall suitability
+
+Return only a single number (0-100) for the product below.""",
+    suffix="""Product: $product
+Score (0-100): """,
+)
+
+# Appended once to the extraction agent's system prompt, so it is part of the cached prefix
+EXTRACTION_INSTRUCTIONS = """When a task gives you a search result, extract the fashion product information it contains.
+
+If it contains a fashion product, return (with final_answer) a Python dictionary with these keys:
+- name: product name
+- brand: brand name or "Unknown"
+- color: color or "Various"
+- size: size or "Various"
+- price: price in euros (number) or None if unknown
+- material: material or "Mixed"
+- type: product category
+
+Return ONLY the dictionary, nothing else. Example:
+{"name": "Product Name", "brand": "Brand", "color": "Color", "size": "Size", "price": 50, "material": "Material", "type": "type"}
+
+Use None for a price the search result does not give, never a guess.
+If no fashion product found, return an empty dictionary: {}"""
+
+EXTRACTION_TASK = Template("""Extract the fashion product from this search result.
+
+Search result: $snippet""")
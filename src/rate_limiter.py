@@ -0,0 +1,281 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from deadline import HTTP_TIMEOUT, DeadlineExceeded, current_deadline
+from model_tiers import get_usage_tracker, token_usage
+
+load_dotenv()
+
+# Lower number = served first when the buckets are empty.
+# The interactive advisor must never wait behind bulk judging/extraction.
+STAGE_PRIORITIES = {
+    "advisor": 0,
+    "price": 1,
+    "image": 1,
+    "extraction": 2,
+    "judge": 2,
+    "default": 2,
+}
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class TokenBucket:
+    """A bucket refilled continuously at `capacity` units per minute."""
+
+    def __init__(self, capacity_per_minute: float):
+        self.capacity = float(capacity_per_minute)
+        self.rate = self.capacity / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.available = min(self.capacity, self.available + elapsed * self.rate)
+            self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (0 if they already are)."""
+        self._refill(now)
+        # A single oversized request only has to wait for a full bucket
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self.available -= min(amount, self.capacity)
+
+
+def estimate_tokens(messages: Any, max_tokens: int = 0) -> int:
+    """Rough token estimate (~4 characters per token) for a chat request."""
+    if isinstance(messages, list):
+        chars = 0
+        for message in messages:
+            content = message.get("content", "") if isinstance(message, dict) else message
+            chars += len(str(content))
+    else:
+        chars = len(str(messages))
+    return chars // 4 + max_tokens
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Read the Retry-After header (in seconds) from a provider error, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for rate-limit, overload, timeout and transient server errors."""
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    name = type(error).__name__
+    return any(
+        marker in name
+        for marker in ("RateLimit", "Overloaded", "Timeout", "ServiceUnavailable", "APIConnection", "ConnectionError")
+    )
+
+
+class RateLimiter:
+    """Process-wide scheduler in front of every model call.
+
+    Callers are admitted in priority order once both the requests-per-minute
+    and tokens-per-minute buckets have room. Retryable failures are retried
+    with jittered exponential backoff, and a Retry-After from the provider
+    pauses every caller, not just the one that got throttled.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 50,
+        tokens_per_minute: float = 40000,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._cond = threading.Condition()
+        self._waiters: List[tuple] = []
+        self._counter = itertools.count()
+        self._blocked_until = 0.0
+
+    def acquire(self, tokens: int = 0, stage: str = "default") -> None:
+        """Block until this caller is the highest-priority waiter and both buckets have room.
+
+        Raises DeadlineExceeded if the request deadline expires while waiting.
+        """
+        deadline = current_deadline()
+        priority = STAGE_PRIORITIES.get(stage, STAGE_PRIORITIES["default"])
+        ticket = (priority, next(self._counter))
+
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            self._cond.notify_all()
+            try:
+                while True:
+                    deadline.check(f"a {stage} model call")
+                    timeout = None
+                    if self._waiters[0] == ticket:
+                        now = time.monotonic()
+                        timeout = max(
+                            self._blocked_until - now,
+                            self.requests.wait_time(1, now),
+                            self.tokens.wait_time(tokens, now),
+                        )
+                        if timeout <= 0:
+                            self.requests.consume(1)
+                            self.tokens.consume(tokens)
+                            return
+                    remaining = deadline.remaining()
+                    if remaining is not None:
+                        # Wake up in time to give up when the deadline expires
+                        timeout = remaining if timeout is None else min(timeout, remaining)
+                    self._cond.wait(timeout=timeout)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for `seconds` (e.g. after a Retry-After)."""
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt (0-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2**attempt)))
+
+    def call(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        stage: str = "default",
+        estimated_tokens: int = 0,
+        model_id: Optional[str] = None,
+        **kwargs,
+    ) -> Any:
+        """Run `fn(*args, **kwargs)` under the rate limits, retrying transient errors.
+
+        The call is refused up front if it could exceed the stage token budget, and its
+        reported token usage and latency (queueing and retries included) are recorded.
+        No retry is attempted if its backoff would outlast the request deadline.
+        """
+        usage = get_usage_tracker()
+        usage.check(stage, estimated_tokens)
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            self.acquire(tokens=estimated_tokens, stage=stage)
+            try:
+                result = fn(*args, **kwargs)
+                tokens = token_usage(result) or (estimated_tokens, 0, 0, 0)
+                usage.record(
+                    stage, model_id, tokens[0], tokens[1], time.monotonic() - started,
+                    cache_read=tokens[2], cache_write=tokens[3],
+                )
+                return result
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    delay = retry_after + random.uniform(0, self.base_delay)
+                    self.pause(delay)
+                else:
+                    delay = self.backoff_delay(attempt)
+                remaining = current_deadline().remaining()
+                if remaining is not None and delay >= remaining:
+                    raise DeadlineExceeded(
+                        f"[{stage}] no time left to retry after {type(e).__name__}"
+                    ) from e
+                print(
+                    f"[{stage}] model call failed ({type(e).__name__}), "
+                    f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+                )
+                time.sleep(delay)
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the process-wide limiter, configured from the environment on first use."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(
+                requests_per_minute=float(os.getenv("FASHION_AGENT_RPM", 50)),
+                tokens_per_minute=float(os.getenv("FASHION_AGENT_TPM", 40000)),
+                max_retries=int(os.getenv("FASHION_AGENT_MAX_RETRIES", 5)),
+            )
+        return _limiter
+
+
+class RateLimitedModel:
+    """Wraps a smolagents model so every `generate` goes through the shared limiter.
+
+    Everything else (model_id, to_dict, ...) is forwarded to the wrapped model,
+    so the wrapper can be handed to agents and tools in place of the model.
+    """
+
+    def __init__(self, model: Any, stage: str = "default", limiter: Optional[RateLimiter] = None):
+        self.model = model
+        self.stage = stage
+        self.limiter = limiter or get_rate_limiter()
+
+    def generate(self, messages, **kwargs):
+        # A call never outlives the request deadline
+        kwargs.setdefault("timeout", current_deadline().timeout(HTTP_TIMEOUT))
+        max_tokens = kwargs.get("max_tokens") or getattr(self.model, "kwargs", {}).get("max_tokens", 0)
+        return self.limiter.call(
+            self.model.generate,
+            messages,
+            stage=self.stage,
+            estimated_tokens=estimate_tokens(messages, max_tokens or 0),
+            model_id=getattr(self.model, "model_id", None),
+            **kwargs,
+        )
+
+    def __call__(self, messages, **kwargs):
+        return self.generate(messages, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self.model, name)
+
+
+def with_rate_limit(model: Any, stage: str) -> Any:
+    """Wrap `model` for `stage`, re-tagging it if it is already wrapped."""
+    if model is None:
+        return None
+    if isinstance(model, RateLimitedModel):
+        return RateLimitedModel(model.model, stage=stage, limiter=model.limiter)
+    return RateLimitedModel(model, stage=stage)
@@ -0,0 +1,340 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from smolagents import Tool
+
+from deadline import DeadlineExceeded, current_deadline
+from dedup import normalize_tokens
+from single_flight import canonical_url
+
+load_dotenv()
+
+# Providers tried in this order; the next one is hedged in when the current one is slow or fails
+DEFAULT_PROVIDERS = os.getenv("FASHION_AGENT_SEARCH_PROVIDERS", "ddgs,bing")
+# Seconds without an answer before the next provider is queried as well
+DEFAULT_HEDGE_DELAY = float(os.getenv("FASHION_AGENT_SEARCH_HEDGE_MS", 1500)) / 1000
+# Query every provider at once and merge their results instead of keeping the first answer
+DEFAULT_MERGE = os.getenv("FASHION_AGENT_SEARCH_MERGE", "0") == "1"
+# How long to wait for more providers after the first answer, when merging
+DEFAULT_MERGE_WINDOW = float(os.getenv("FASHION_AGENT_SEARCH_MERGE_WINDOW_MS", 500)) / 1000
+DEFAULT_FIXTURES_PATH = os.getenv("FASHION_AGENT_SEARCH_FIXTURES", "fixtures/search_results.json")
+# Max seconds for one search, all providers included
+DEFAULT_SEARCH_TIMEOUT = float(os.getenv("FASHION_AGENT_SEARCH_TIMEOUT", 20))
+
+
+class SearchError(RuntimeError):
+    """Every search provider failed for a query."""
+
+
+class SearchResult:
+    """One search hit, in the same shape whatever provider returned it."""
+
+    __slots__ = ("title", "url", "snippet", "provider")
+
+    def __init__(self, title: str, url: str, snippet: str, provider: str):
+        self.title = (title or "").strip()
+        self.url = (url or "").strip()
+        self.snippet = " ".join((snippet or "").split())
+        self.provider = provider
+
+    def to_prompt(self) -> str:
+        """The result as given to the extraction model, one labelled field per line."""
+        return f"Title: {self.title}\nURL: {self.url}\nSnippet: {self.snippet}"
+
+    def __str__(self) -> str:
+        # Searchable text, e.g. for snippet ranking
+        return f"{self.title} {self.snippet}"
+
+    def to_markdown(self) -> str:
+        """The `[title](url)\\nsnippet` form of the smolagents search tools."""
+        return f"[{self.title}]({self.url})\n{self.snippet}"
+
+    def __repr__(self) -> str:
+        return f"SearchResult({self.title!r}, {self.url!r}, provider={self.provider!r})"
+
+
+def format_results(results: List[SearchResult]) -> str:
+    """Markdown listing, as returned by the smolagents search tools."""
+    return "## Search Results\n\n" + "\n\n".join(result.to_markdown() for result in results)
+
+
+class SearchProvider:
+    """A search backend: `search` returns normalized results, best first."""
+
+    name = "provider"
+
+    def search(self, query: str, max_results: int) -> List[SearchResult]:
+        raise NotImplementedError
+
+
+class DDGSProvider(SearchProvider):
+    """DuckDuckGo through the `ddgs` package (what DuckDuckGoSearchTool uses), at most one query per second."""
+
+    name = "ddgs"
+
+    def __init__(self, min_interval: float = 1.0):
+        try:
+            from ddgs import DDGS
+        except ImportError:
+            from duckduckgo_search import DDGS
+        self.ddgs = DDGS(timeout=int(DEFAULT_SEARCH_TIMEOUT))
+        self.min_interval = min_interval
+        self._last_request = 0.0
+        self._lock = threading.Lock()
+
+    def search(self, query: str, max_results: int) -> List[SearchResult]:
+        with self._lock:
+            wait_time = self._last_request + self.min_interval - time.monotonic()
+            if wait_time > 0:
+                time.sleep(wait_time)
+            self._last_request = time.monotonic()
+        hits = self.ddgs.text(query, max_results=max_results) or []
+        return [SearchResult(hit.get("title"), hit.get("href"), hit.get("body"), self.name) for hit in hits]
+
+
+class WebSearchProvider(SearchProvider):
+    """An engine of smolagents' WebSearchTool ("duckduckgo" lite HTML or "bing" RSS), no API key needed."""
+
+    def __init__(self, engine: str):
+        from smolagents import WebSearchTool
+
+        self.name = engine
+        self.tool = WebSearchTool(engine=engine)
+
+    def search(self, query: str, max_results: int) -> List[SearchResult]:
+        hits = self.tool.search(query)[:max_results]
+        return [SearchResult(hit.get("title"), hit.get("link"), hit.get("description"), self.name) for hit in hits]
+
+
+class FixtureProvider(SearchProvider):
+    """Offline backend over a local JSON list of {title, url, snippet}, ranked by word overlap with the query.
+
+    For development and benchmarks without network access or provider quotas.
+    """
+
+    name = "fixture"
+
+    def __init__(self, path: str = DEFAULT_FIXTURES_PATH):
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+        self.results = [
+            SearchResult(entry.get("title"), entry.get("url"), entry.get("snippet"), self.name)
+            for entry in entries
+        ]
+        self._tokens = [
+            set(normalize_tokens(f"{result.title} {result.snippet}")) for result in self.results
+        ]
+
+    def search(self, query: str, max_results: int) -> List[SearchResult]:
+        words = set(normalize_tokens(query))
+        scored = [
+            (len(words & tokens), i) for i, tokens in enumerate(self._tokens) if words & tokens
+        ]
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [self.results[i] for _, i in scored[:max_results]]
+
+
+PROVIDERS = {
+    "ddgs": DDGSProvider,
+    "duckduckgo": lambda: WebSearchProvider("duckduckgo"),
+    "bing": lambda: WebSearchProvider("bing"),
+    "fixture": FixtureProvider,
+}
+
+
+def merge_results(answers: List[List[SearchResult]], max_results: int) -> List[SearchResult]:
+    """Interleave several providers' rankings, keeping the first hit of each page (canonical URL)."""
+    merged, seen = [], set()
+    for rank in range(max((len(answer) for answer in answers), default=0)):
+        for answer in answers:
+            if rank < len(answer):
+                key = canonical_url(answer[rank].url)
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(answer[rank])
+    return merged[:max_results]
+
+
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+
+
+class HedgedSearch:
+    """Search over several providers so one provider's slow moments do not set the tail latency.
+
+    The first provider is queried alone; if it has not answered after
+    `hedge_delay` seconds (or fails, or finds nothing), the next one is queried
+    as well, and the first non-empty answer wins. With `merge`, every provider
+    is queried at once and the answers arriving within `merge_window` of the
+    first one are merged. Waiting never outlasts `timeout` nor the request
+    deadline; providers still running then are left to finish in the background.
+    """
+
+    def __init__(self, providers: List[SearchProvider], hedge_delay: float = DEFAULT_HEDGE_DELAY,
+                 merge: bool = DEFAULT_MERGE, merge_window: float = DEFAULT_MERGE_WINDOW,
+                 timeout: float = DEFAULT_SEARCH_TIMEOUT):
+        if not providers:
+            raise ValueError("HedgedSearch needs at least one search provider")
+        self.providers = providers
+        self.hedge_delay = hedge_delay
+        self.merge = merge
+        self.merge_window = merge_window
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.wins: Dict[str, int] = defaultdict(int)
+        self.failures: Dict[str, int] = defaultdict(int)
+        self.seconds: Dict[str, float] = defaultdict(float)
+
+    def _query(self, provider: SearchProvider, query: str, max_results: int) -> List[SearchResult]:
+        started = time.monotonic()
+        try:
+            return provider.search(query, max_results)
+        except Exception:
+            with self._lock:
+                self.failures[provider.name] += 1
+            raise
+        finally:
+            with self._lock:
+                self.calls[provider.name] += 1
+                self.seconds[provider.name] += time.monotonic() - started
+
+    def search(self, query: str, max_results: int = 10) -> List[SearchResult]:
+        deadline = current_deadline()
+        gives_up_at = time.monotonic() + self.timeout
+        queue = list(self.providers)
+        pending = {}
+        answers, errors = [], []
+        first_answer_at: Optional[float] = None
+
+        def launch():
+            provider = queue.pop(0)
+            # The provider call sees the caller's deadline
+            context = contextvars.copy_context()
+            pending[_executor.submit(context.run, self._query, provider, query, max_results)] = provider
+
+        launch()
+        while self.merge and queue:
+            launch()
+
+        while pending:
+            waits = [deadline.remaining(), max(gives_up_at - time.monotonic(), 0)]
+            if queue:
+                waits.append(self.hedge_delay)
+            if first_answer_at is not None:
+                waits.append(max(first_answer_at + self.merge_window - time.monotonic(), 0))
+            waits = [w for w in waits if w is not None]
+            done, _ = wait(pending, timeout=min(waits) if waits else None, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    found = future.result()
+                except Exception as e:
+                    print(f"Search provider {provider.name} failed for '{query}': {e}")
+                    errors.append(f"{provider.name}: {e}")
+                    continue
+                if found:
+                    answers.append(found)
+                    if first_answer_at is None:
+                        first_answer_at = time.monotonic()
+                        with self._lock:
+                            self.wins[provider.name] += 1
+
+            if answers and (not self.merge or not pending
+                            or time.monotonic() >= first_answer_at + self.merge_window):
+                break
+            if deadline.expired or time.monotonic() >= gives_up_at:
+                break
+            if queue and (not done or not answers):
+                # The current providers are slow, failed or found nothing: hedge with the next one
+                if not done:
+                    print(f"Search for '{query}' slow, hedging with {queue[0].name}")
+                launch()
+
+        if answers:
+            return merge_results(answers, max_results) if self.merge else answers[0][:max_results]
+        if deadline.expired:
+            raise DeadlineExceeded(f"search deadline expired for '{query}'")
+        if errors or pending:
+            errors += [f"{provider.name}: no answer after {self.timeout:.0f}s" for provider in pending.values()]
+            raise SearchError(f"All search providers failed for '{query}': {'; '.join(errors)}")
+        return []
+
+    def report(self) -> str:
+        """One line per provider: calls, first answers, failures and average latency."""
+        with self._lock:
+            if not self.calls:
+                return "Search providers: no calls"
+            lines = ["Search providers:"]
+            for name, calls in self.calls.items():
+                lines.append(
+                    f"  {name}: {calls} calls | {self.wins[name]} first answers | "
+                    f"{self.failures[name]} failures | {self.seconds[name] / calls:.2f}s avg"
+                )
+        return "\n".join(lines)
+
+
+def load_providers(spec: str = DEFAULT_PROVIDERS) -> List[SearchProvider]:
+    """Providers named in `spec` ("ddgs,bing"); unknown or unavailable ones are skipped."""
+    providers = []
+    for name in (part.strip() for part in spec.split(",")):
+        if not name:
+            continue
+        factory = PROVIDERS.get(name)
+        if factory is None:
+            print(f"Ignoring unknown search provider: {name}")
+            continue
+        try:
+            providers.append(factory())
+        except (ImportError, OSError, ValueError) as e:
+            print(f"Search provider {name} unavailable: {e}")
+    return providers
+
+
+_search: Optional[HedgedSearch] = None
+_search_lock = threading.Lock()
+
+
+def get_search() -> HedgedSearch:
+    """The process-wide search layer, configured from the environment on first use."""
+    global _search
+    with _search_lock:
+        if _search is None:
+            _search = HedgedSearch(load_providers())
+        return _search
+
+
+def search_results(query: str, max_results: int = 10) -> List[SearchResult]:
+    """Structured results of a search; raises SearchError if there are none."""
+    results = get_search().search(query, max_results)
+    if not results:
+        raise SearchError("No results found! Try a less restrictive/shorter query.")
+    return results
+
+
+def search_text(query: str, max_results: int = 10) -> str:
+    """Search results as the markdown listing of the smolagents search tools, for prompts and agents."""
+    return format_results(search_results(query, max_results))
+
+
+class SearchTool(Tool):
+    """`web_search` tool for agents, backed by the hedged multi-provider search."""
+
+    name = "web_search"
+    description = "Performs a web search for a query and returns a string of the top search results formatted as markdown with titles, links, and descriptions."
+    inputs = {"query": {"type": "string", "description": "The search query to perform."}}
+    output_type = "string"
+
+    def __init__(self, max_results: int = 10):
+        super().__init__()
+        self.max_results = max_results
+
+    def forward(self, query: str) -> str:
+        return search_text(query, self.max_results)
@@ -0,0 +1,97 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track the visit and never change the page content
+TRACKING_PARAMS = {
+    "cp", "macro", "ds_rl", "gclid", "gclsrc", "gad_source", "msclkid", "fbclid",
+    "dclid", "yclid", "mc_cid", "mc_eid", "ref", "ref_", "tag", "srsltid",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "mtm_")
+
+
+def canonical_url(url: str) -> str:
+    """URL identity for coalescing: lowercase host, no fragment, tracking parameters dropped, query sorted."""
+    parts = urlsplit(str(url).strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower() or "https", host, path, urlencode(query), ""))
+
+
+class InFlightCall:
+    """One execution shared by every caller that asked for the same key meanwhile."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        """Result of the shared execution; re-raises its exception."""
+        if not self.done.wait(timeout):
+            raise TimeoutError("Shared call still running")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """Coalesce identical concurrent calls: the first caller of a key runs it, the others wait for its result.
+
+    Nothing is cached: once the call finishes, the next caller of the key runs it again.
+    Use `do` for a single call, or `begin`/`finish` when the leader computes several
+    keys together (e.g. a batched price lookup).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, InFlightCall] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def begin(self, key: Hashable) -> Tuple[InFlightCall, bool]:
+        """(call, leader): leader is True if the caller must run the call and `finish` it."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                return call, False
+            call = self._calls[key] = InFlightCall()
+            self.executed += 1
+            return call, True
+
+    def finish(self, key: Hashable, call: InFlightCall, result: Any = None,
+               error: Optional[BaseException] = None) -> None:
+        """Publish the leader's result (or exception) to every waiter."""
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.result, call.error = result, error
+        call.done.set()
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run `fn(*args, **kwargs)`, or wait for the identical call already in flight."""
+        call, leader = self.begin(key)
+        if not leader:
+            print(f"--- {self.name}: joining in-flight call for {key} ---")
+            return call.wait()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.finish(key, call, error=e)
+            raise
+        self.finish(key, call, result=result)
+        return result
+
+    def stats(self) -> str:
+        return f"{self.name}: {self.executed} executed, {self.coalesced} coalesced"
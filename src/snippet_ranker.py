@@ -0,0 +1,77 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from dedup import normalize_tokens
+
+# How much each criterion counts in the query; the product type matters most
+CRITERIA_WEIGHTS = {
+    "type": 2.0,
+    "style": 1.0,
+    "colors": 1.0,
+    "materials": 1.0,
+    "brands": 1.5,
+    "season": 0.5,
+}
+
+
+def criteria_query(criteria: Dict[str, Any]) -> Dict[str, float]:
+    """Weighted query terms built from validated criteria."""
+    weights: Dict[str, float] = {}
+    for key, weight in CRITERIA_WEIGHTS.items():
+        values = criteria.get(key) or []
+        if isinstance(values, str):
+            values = values.split(",")
+        for value in values:
+            for token in normalize_tokens(value):
+                weights[token] = max(weights.get(token, 0.0), weight)
+    return weights
+
+
+def bm25_scores(
+    snippets: List[str], query: Dict[str, float], k1: float = 1.5, b: float = 0.75
+) -> np.ndarray:
+    """BM25 score of every snippet against the weighted query terms."""
+    if not snippets or not query:
+        return np.zeros(len(snippets))
+
+    terms = list(query)
+    column = {term: j for j, term in enumerate(terms)}
+    docs = [normalize_tokens(snippet) for snippet in snippets]
+
+    # Term-frequency matrix restricted to the query vocabulary (snippets x terms)
+    tf = np.zeros((len(docs), len(terms)))
+    for i, tokens in enumerate(docs):
+        for token in tokens:
+            j = column.get(token)
+            if j is not None:
+                tf[i, j] += 1
+
+    lengths = np.array([len(tokens) for tokens in docs], dtype=float)
+    avg_length = lengths.mean() or 1.0
+    doc_freq = (tf > 0).sum(axis=0)
+    idf = np.log1p((len(docs) - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    norm = k1 * (1 - b + b * lengths / avg_length)
+    saturated = tf * (k1 + 1) / (tf + norm[:, None])
+    return saturated @ (idf * np.array([query[term] for term in terms]))
+
+
+def rank_snippets(
+    snippets: List[Any],
+    criteria: Dict[str, Any],
+    min_score: Optional[float] = None,
+) -> List[Tuple[Any, float]]:
+    """Order snippets by relevance to the criteria, best first.
+
+    Snippets may be strings or anything whose str() is the searchable text.
+    Those scoring below `min_score` are dropped when it is given.
+    """
+    scores = bm25_scores([str(snippet) for snippet in snippets], criteria_query(criteria))
+    # Stable sort keeps the backend order between equally relevant snippets
+    order = np.argsort(-scores, kind="stable")
+    return [
+        (snippets[i], float(scores[i]))
+        for i in order
+        if min_score is None or scores[i] >= min_score
+    ]
@@ -0,0 +1,89 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from deadline import Deadline, current_deadline, deadline_scope
+from dedup import normalize_tokens
+from product_record import ProductRecord
+
+
+class SpeculativePrefetcher:
+    """Start product search and extraction while the advisor dialogue is still running.
+
+    `observe` is given the partially known criteria after each advisor turn; as
+    soon as the required slots (type and style by default) are known, a search
+    for them starts in the background on a dedicated ProductSheetAgent. When the
+    final criteria arrive, `take` returns the prefetched products if the slots
+    still match, and drops every other speculative job.
+
+    Each job runs under its own deadline; a dropped job's deadline is cancelled,
+    which interrupts the prefetch agent instead of letting it keep calling the
+    model while the real search runs.
+    """
+
+    def __init__(self, agent, required_slots: Tuple[str, ...] = ("type", "style"), timeout: float = 120):
+        # A separate agent: smolagents agents are not safe to run from two threads at once
+        self.agent = agent
+        self.required_slots = required_slots
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._jobs: Dict[Tuple[str, ...], Tuple[Future, Deadline]] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, criteria: Dict[str, Any]) -> Optional[Tuple[str, ...]]:
+        key = tuple(" ".join(normalize_tokens(criteria.get(slot) or "")) for slot in self.required_slots)
+        return key if all(key) else None
+
+    def observe(self, partial_criteria: Dict[str, Any]) -> None:
+        """Start a background search the first time a new combination of required slots is known."""
+        key = self._key(partial_criteria)
+        if key is None:
+            return
+        with self._lock:
+            if key in self._jobs:
+                return
+            print(f"Prefetching products for {dict(zip(self.required_slots, key))} in background...")
+            deadline = Deadline(name="prefetch")
+            future = self._executor.submit(self._prefetch, deadline, dict(partial_criteria))
+            self._jobs[key] = (future, deadline)
+
+    def _prefetch(self, deadline: Deadline, criteria: Dict[str, Any]) -> List[ProductRecord]:
+        with deadline_scope(deadline):
+            deadline.check("prefetch")
+            return self.agent.prefetch_products(criteria)
+
+    @staticmethod
+    def _discard(future: Future, deadline: Deadline) -> None:
+        """Drop a job: cancelled if still queued, interrupted if already running."""
+        future.cancel()
+        deadline.cancel()
+
+    def take(self, criteria: Dict[str, Any]) -> List[ProductRecord]:
+        """Prefetched products matching the final criteria ([] if none); other jobs are discarded."""
+        key = self._key(criteria)
+        with self._lock:
+            job = self._jobs.pop(key, None) if key is not None else None
+            discarded = list(self._jobs.values())
+            self._jobs.clear()
+        for future, deadline in discarded:
+            self._discard(future, deadline)
+
+        if job is None:
+            return []
+        future, deadline = job
+        try:
+            products = future.result(timeout=current_deadline().timeout(self.timeout))
+        except Exception as e:
+            print(f"Prefetch failed, searching from scratch: {e}")
+            self._discard(future, deadline)
+            return []
+        print(f"Reusing {len(products)} prefetched products")
+        return products
+
+    def close(self) -> None:
+        with self._lock:
+            discarded = list(self._jobs.values())
+            self._jobs.clear()
+        for future, deadline in discarded:
+            self._discard(future, deadline)
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,99 @@
+from io import BytesIO
+from typing import BinaryIO, Iterator, List, Optional, Sequence, Tuple, Union
+
+from PIL import Image, ImageDraw, ImageFont
+
+DEFAULT_THUMB_SIZE = (256, 256)
+CAPTION_HEIGHT = 32
+PADDING = 8
+BACKGROUND = (255, 255, 255)
+PLACEHOLDER = (211, 211, 211)
+TEXT_COLOR = (0, 0, 0)
+PNG_CHUNK_SIZE = 64 * 1024
+
+
+def _load_font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1 has a single fixed-size bitmap font
+        return ImageFont.load_default()
+
+
+def _draw_centered(draw: ImageDraw.ImageDraw, box: Tuple[int, int, int, int], text: str, font) -> None:
+    left, top, right, bottom = draw.multiline_textbbox((0, 0), text, font=font, align='center')
+    x = box[0] + (box[2] - box[0] - (right - left)) // 2
+    y = box[1] + (box[3] - box[1] - (bottom - top)) // 2
+    draw.multiline_text((x, y), text, fill=TEXT_COLOR, font=font, align='center')
+
+
+def render_contact_sheet(
+    images: Sequence[Optional[Image.Image]],
+    captions: Sequence[str],
+    columns: int = 3,
+    thumb_size: Tuple[int, int] = DEFAULT_THUMB_SIZE,
+) -> Image.Image:
+    """
+    Tile images into a single RGB sheet, one cell per image with its caption below.
+
+    Each image is shrunk to fit `thumb_size` and centered in its cell; a missing
+    image (None) gets a gray "Failed to load" placeholder. The sheet holds
+    columns x rows cells, so time and memory grow with the thumbnail size only.
+
+    Parameters:
+    images (list): PIL images, or None for images that failed to download
+    captions (list): Text under each image, e.g. its price
+    columns (int): Number of columns in the grid (default: 3)
+    thumb_size (tuple): Maximum (width, height) of each thumbnail (default: (256, 256))
+
+    Returns:
+    PIL.Image: The composed sheet
+    """
+    if len(images) != len(captions):
+        raise ValueError("Number of images and captions must be equal")
+
+    columns = max(1, min(columns, len(images) or 1))
+    rows = (len(images) + columns - 1) // columns
+    thumb_w, thumb_h = thumb_size
+    cell_w, cell_h = thumb_w + 2 * PADDING, thumb_h + CAPTION_HEIGHT + 2 * PADDING
+
+    sheet = Image.new('RGB', (columns * cell_w, max(rows, 1) * cell_h), BACKGROUND)
+    draw = ImageDraw.Draw(sheet)
+    font = _load_font(CAPTION_HEIGHT // 2)
+
+    for i, (image, caption) in enumerate(zip(images, captions)):
+        x = (i % columns) * cell_w + PADDING
+        y = (i // columns) * cell_h + PADDING
+        thumb_box = (x, y, x + thumb_w, y + thumb_h)
+
+        if image is None:
+            draw.rectangle(thumb_box, fill=PLACEHOLDER)
+            _draw_centered(draw, thumb_box, "Failed to load", font)
+        else:
+            thumb = image.copy() if image.size[0] > thumb_w or image.size[1] > thumb_h else image
+            thumb.thumbnail(thumb_size)
+            if thumb.mode != 'RGB':
+                thumb = thumb.convert('RGB')
+            sheet.paste(thumb, (x + (thumb_w - thumb.size[0]) // 2, y + (thumb_h - thumb.size[1]) // 2))
+
+        _draw_centered(draw, (x, y + thumb_h, x + thumb_w, y + thumb_h + CAPTION_HEIGHT), str(caption), font)
+
+    return sheet
+
+
+def save_contact_sheet(sheet: Image.Image, fp: Union[str, BinaryIO]) -> None:
+    """Write the sheet as PNG to a path or binary file object."""
+    # compress_level 1: a thumbnail grid gains little from slower zlib levels
+    sheet.save(fp, format='PNG', compress_level=1)
+
+
+def iter_contact_sheet_png(sheet: Image.Image, chunk_size: int = PNG_CHUNK_SIZE) -> Iterator[bytes]:
+    """PNG bytes of the sheet in chunks, e.g. for a streamed HTTP response."""
+    buffer = BytesIO()
+    save_contact_sheet(sheet, buffer)
+    view = buffer.getbuffer()
+    for start in range(0, len(view), chunk_size):
+        yield bytes(view[start:start + chunk_size])
+
+
+def price_captions(prices: List) -> List[str]:
+    return [f"Price: ${price}" for price in prices]
@@ -0,0 +1,102 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import List, NamedTuple, Optional, Tuple
+
+import requests
+from PIL import Image
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+# Enough workers for a full grid, so it loads in about the time of the slowest image
+MAX_WORKERS = 20
+# (connect, read) timeouts of each request; `timeout` bounds the whole download
+CONNECT_TIMEOUT = 5
+DEFAULT_TIMEOUT = 10
+# Images are decoded straight to thumbnail size, a grid cell never needs more
+DEFAULT_MAX_SIZE = (512, 512)
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class DownloadedImage(NamedTuple):
+    url: str
+    image: Optional[Image.Image]
+    error: Optional[Exception]
+
+
+def get_session() -> requests.Session:
+    """Shared session: keep-alive connections are reused across images of the same host."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['User-Agent'] = USER_AGENT
+            _session = session
+    return _session
+
+
+def _read_body(response: requests.Response, deadline: float) -> bytes:
+    """Read the response body, giving up past `deadline` or MAX_IMAGE_BYTES."""
+    buffer = BytesIO()
+    for chunk in response.iter_content(CHUNK_SIZE):
+        buffer.write(chunk)
+        if buffer.tell() > MAX_IMAGE_BYTES:
+            raise ValueError(f"Image larger than {MAX_IMAGE_BYTES} bytes")
+        if time.monotonic() > deadline:
+            raise requests.exceptions.Timeout("Image download exceeded its timeout")
+    return buffer.getvalue()
+
+
+def decode_thumbnail(data: bytes, max_size: Tuple[int, int] = DEFAULT_MAX_SIZE) -> Image.Image:
+    """Decode image bytes to an RGB image no larger than `max_size`.
+
+    `draft` lets the JPEG decoder scale down by 1/2..1/8 while decoding, so
+    full-resolution pixels are never held in memory.
+    """
+    image = Image.open(BytesIO(data))
+    image.draft('RGB', max_size)
+    image.thumbnail(max_size)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def download_image(url: str, timeout: float = DEFAULT_TIMEOUT,
+                   max_size: Tuple[int, int] = DEFAULT_MAX_SIZE) -> Image.Image:
+    """Download one image as a thumbnail; raises on network or decoding errors."""
+    deadline = time.monotonic() + timeout
+    with get_session().get(url, timeout=(CONNECT_TIMEOUT, timeout), stream=True) as response:
+        response.raise_for_status()
+        data = _read_body(response, deadline)
+    return decode_thumbnail(data, max_size)
+
+
+def _download(url: str, timeout: float, max_size: Tuple[int, int]) -> DownloadedImage:
+    try:
+        return DownloadedImage(url, download_image(url, timeout, max_size), None)
+    except Exception as e:
+        return DownloadedImage(url, None, e)
+
+
+def download_images(image_urls: List[str], timeout: float = DEFAULT_TIMEOUT,
+                    max_size: Tuple[int, int] = DEFAULT_MAX_SIZE,
+                    max_workers: int = MAX_WORKERS) -> List[DownloadedImage]:
+    """Download all images concurrently, in input order.
+
+    A failed image yields `image=None` and its exception instead of failing
+    the batch, so the whole grid takes about as long as the slowest image.
+    """
+    if not image_urls:
+        return []
+    print(f"Downloading {len(image_urls)} images...")
+    workers = max(1, min(max_workers, len(image_urls)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-download") as executor:
+        return list(executor.map(lambda url: _download(url, timeout, max_size), image_urls))
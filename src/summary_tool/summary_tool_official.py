@@ -1,24 +1,79 @@
 
 
-def display_tool(sample_urls, sample_prices):
-    import requests
-    from PIL import Image
-    import matplotlib
-    import matplotlib.pyplot as plt
-    import numpy as np
-    from io import BytesIO
+def display_tool(sample_urls, sample_prices, backend="pillow"):
     import os
     from fetch_and_extract_image import extrate_images
+    from image_downloader import download_images
+    from contact_sheet import price_captions, render_contact_sheet, save_contact_sheet
 
-    # Set matplotlib backend to avoid display issues
-    try:
-        # Try to use a backend that works well on different systems
-        if os.name == 'nt':  # Windows
-            matplotlib.use('TkAgg')
-        else:
-            matplotlib.use('Agg')  # For headless systems
-    except:
-        pass
+    # matplotlib is an optional backend, only needed by the subplot-based displays
+    plt = np = None
+    if backend == "matplotlib":
+        import matplotlib
+        import matplotlib.pyplot as plt
+        import numpy as np
+
+        # Set matplotlib backend to avoid display issues
+        try:
+            # Try to use a backend that works well on different systems
+            if os.name == 'nt':  # Windows
+                matplotlib.use('TkAgg')
+            else:
+                matplotlib.use('Agg')  # For headless systems
+        except:
+            pass
+
+    def display_contact_sheet(image_urls, prices, columns=3, thumb_size=(256, 256), save_path=None):
+        """
+        Downloads images and shows them with their prices as a single contact sheet.
+
+        Thumbnails are pasted into one Pillow image instead of a matplotlib
+        figure, so the cost follows the thumbnail size rather than a figure DPI.
+
+        Parameters:
+        image_urls (list): List of image URLs to download
+        prices (list): List of prices/values corresponding to each image
+        columns (int): Number of columns in the grid (default: 3)
+        thumb_size (tuple): Maximum size of each thumbnail (default: (256, 256))
+        save_path (str): Optional path to save the sheet as PNG instead of displaying
+
+        Returns:
+        list: Downloaded images as PIL Image objects (None for failures)
+        """
+        if len(image_urls) != len(prices):
+            raise ValueError("Number of images and prices must be equal")
+
+        if len(image_urls) == 0:
+            print("No images to display")
+            return []
+
+        downloaded_images = []
+        for i, result in enumerate(download_images(image_urls, max_size=thumb_size)):
+            if result.error is not None:
+                print(f"Error loading image {i + 1}: {result.error}")
+            downloaded_images.append(result.image)
+
+        sheet = render_contact_sheet(downloaded_images, price_captions(prices), columns=columns, thumb_size=thumb_size)
+
+        if save_path:
+            save_contact_sheet(sheet, save_path)
+            print(f"Contact sheet saved to {save_path}")
+            return downloaded_images
+
+        sheet.show(title="Product Images and Prices")
+        try:
+            user_input = input("\nPress Enter to continue or type 'save' to save the images: ").strip().lower()
+            if user_input == 'save':
+                filename = input("Enter filename (without extension): ").strip()
+                if not filename:
+                    filename = "images_with_prices"
+                save_path = f"{filename}.png"
+                save_contact_sheet(sheet, save_path)
+                print(f"Images saved to {save_path}")
+        except KeyboardInterrupt:
+            print("\nClosing images...")
+
+        return downloaded_images
 
     def display_images_with_prices(image_urls, prices, columns=3, figsize=(15, 10), save_path=None):
         """
@@ -48,24 +103,14 @@ def display_tool(sample_urls, sample_prices):
         # Create figure
         fig = plt.figure(figsize=figsize)
 
-        # Download and display images
+        # Download all images concurrently, then display them
         downloaded_images = []
 
-        for i, (url, price) in enumerate(zip(image_urls, prices)):
+        for i, (result, price) in enumerate(zip(download_images(image_urls), prices)):
             try:
-                # Download image
-                print(f"Downloading image {i + 1}/{len(image_urls)}...")
-                response = requests.get(url, timeout=10, headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                })
-                response.raise_for_status()
-
-                # Open image from bytes
-                image = Image.open(BytesIO(response.content))
-
-                # Convert to RGB if necessary
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
+                if result.error is not None:
+                    raise result.error
+                image = result.image
 
                 downloaded_images.append(image)
 
@@ -77,7 +122,7 @@ def display_tool(sample_urls, sample_prices):
                 ax.set_title(f"Price: ${price}", fontsize=12, fontweight='bold', pad=10)
                 ax.axis('off')
 
-            except requests.exceptions.RequestException as e:
+            except OSError as e:  # network errors (RequestException is an OSError)
                 print(f"Error downloading image {i + 1}: {e}")
                 downloaded_images.append(None)
 
@@ -157,24 +202,14 @@ def display_tool(sample_urls, sample_prices):
         else:
             axes = axes.flatten()
 
-        # Download and display images
+        # Download all images concurrently, then display them
         downloaded_images = []
 
-        for i, (url, price) in enumerate(zip(image_urls, prices)):
+        for i, (result, price) in enumerate(zip(download_images(image_urls), prices)):
             try:
-                # Download image
-                print(f"Downloading image {i + 1}/{len(image_urls)}...")
-                response = requests.get(url, timeout=10, headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                })
-                response.raise_for_status()
-
-                # Open image from bytes
-                image = Image.open(BytesIO(response.content))
-
-                # Convert to RGB if necessary
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
+                if result.error is not None:
+                    raise result.error
+                image = result.image
 
                 downloaded_images.append(image)
 
@@ -228,20 +263,17 @@ def display_tool(sample_urls, sample_prices):
         print("DOWNLOADING AND DISPLAYING PRODUCT INFORMATION")
         print("=" * 60)
 
-        for i, (url, price) in enumerate(zip(image_urls, prices)):
+        results = download_images(image_urls)
+
+        for i, (url, price, result) in enumerate(zip(image_urls, prices, results)):
             try:
                 print(f"\nProduct {i + 1}:")
                 print(f"  Price: ${price}")
-                print(f"  Downloading from: {url[:50]}...")
-
-                response = requests.get(url, timeout=10, headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-                })
-                response.raise_for_status()
+                print(f"  Downloaded from: {url[:50]}...")
 
-                image = Image.open(BytesIO(response.content))
-                if image.mode != 'RGB':
-                    image = image.convert('RGB')
+                if result.error is not None:
+                    raise result.error
+                image = result.image
 
                 downloaded_images.append({'image': image, 'price': price, 'url': url})
                 print(f"  ✓ Successfully downloaded (Size: {image.size})")
@@ -271,7 +303,10 @@ def display_tool(sample_urls, sample_prices):
 
     url_images = [extrate_images(sample_url) for sample_url in sample_urls]
     print(url_images)
-    images = display_images_with_prices_interactive(url_images, sample_prices, columns=len(sample_urls))
+    if backend == "matplotlib":
+        images = display_images_with_prices_interactive(url_images, sample_prices, columns=len(sample_urls))
+    else:
+        images = display_contact_sheet(url_images, sample_prices, columns=len(sample_urls))
     choice = input("Your choice : ")
     return sample_urls[int(choice)]
 
@@ -1,14 +1,27 @@
-from flask import Flask, render_template_string, request
+from flask import Flask, abort, jsonify, request
+import os
 import threading
 import time
-import requests
+import uuid
 from werkzeug.serving import make_server
 from fetch_and_extract_image import extrate_images
+from image_dedup import group_offers
+from summary_tool.image_downloader import download_images
+from price_cache import retailer_of
 from smolagents import tool
 
 app = Flask(__name__)
-selected_result = None
-server = None
+
+GALLERY_HOST = os.getenv("FASHION_AGENT_GALLERY_HOST", "127.0.0.1")
+GALLERY_PORT = int(os.getenv("FASHION_AGENT_GALLERY_PORT", 5000))
+# Galleries nobody answered are dropped after this many seconds
+GALLERY_SESSION_TTL = float(os.getenv("FASHION_AGENT_GALLERY_TTL", 3600))
+# Cards in the first page; the rest are loaded while scrolling
+GALLERY_PAGE_SIZE = int(os.getenv("FASHION_AGENT_GALLERY_PAGE_SIZE", 12))
+# Photos are only downloaded server-side to spot duplicates: small thumbnails, each given
+# at most this many seconds (a photo not there in time keeps its own card)
+DEDUP_DOWNLOAD_TIMEOUT = float(os.getenv("FASHION_AGENT_GALLERY_DEDUP_TIMEOUT", 3))
+DEDUP_THUMBNAIL_SIZE = (64, 64)
 
 html = '''
 <!doctype html>
@@ -46,9 +59,22 @@ html = '''
         .card img {
             width: 100%;
             height: auto;
+            /* Space reserved before the lazy image arrives: no layout shift */
+            aspect-ratio: 1;
+            object-fit: contain;
             border-radius: 8px;
         }
 
+        .no-image {
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            aspect-ratio: 1;
+            background-color: #e8edf2;
+            border-radius: 8px;
+            color: #888;
+        }
+
         .name {
             font-size: 1.1em;
             font-weight: 600;
@@ -113,23 +139,66 @@ html = '''
             font-size: 0.85em;
             color: #888;
         }
+
+        .alternatives {
+            margin-top: 8px;
+            font-size: 0.85em;
+            color: #555;
+        }
+
+        .alternatives a {
+            display: block;
+            color: #3498db;
+        }
+
+        .more {
+            margin: 20px;
+            color: #888;
+        }
+
+        .partial {
+            color: #e67e22;
+            margin-bottom: 10px;
+        }
     </style>
 </head>
 <body>
     <h2>Select your products:</h2>
-    <form method="POST" action="/submit">
-        {% for url, price, name, env_score in items %}
+    {% if partial %}
+    <div class="partial">The search was cut short by its time limit: these are the best products found so far.</div>
+    {% endif %}
+    <form method="POST" action="/gallery/{{ session_id }}/submit">
+        <div id="cards">
+        {% for card in cards %}
         <div class="card">
-            <img src="{{ url }}" alt="Image">
-            <div class="name">{{ name }}</div>
-            <div class="price">{{ price }} €</div>
+            {% if card.image_url %}
+            <img src="{{ card.image_url }}" alt="Image" width="200" height="200" loading="lazy" decoding="async">
+            {% else %}
+            <div class="no-image">No image</div>
+            {% endif %}
+            <div class="name">{{ card.name }}</div>
+            <div class="price">{{ card.price }} €</div>
             <div class="env-score">
                 <span class="co2-icon">💨</span>
-                <span class="co2-text">{{ env_score }} CO₂</span>
+                <span class="co2-text">{{ card.env_score }} CO₂</span>
             </div>
-            <input type="checkbox" name="selected" value="{{ loop.index0 }}"> Select
+            {% if card.alternatives %}
+            <div class="alternatives">Also at:
+                {% for alternative in card.alternatives %}
+                <a href="{{ alternative.url }}" target="_blank">{{ alternative.retailer }} – {{ alternative.price }} €</a>
+                {% endfor %}
+            </div>
+            {% endif %}
+            <input type="checkbox" name="selected" value="{{ card.index }}"> Select
         </div>
         {% endfor %}
+        </div>
+        {% if next_page %}
+        <div class="more" id="more" data-next-page="{{ next_page }}">
+            Showing {{ cards|length }} of {{ total }} products
+            <button type="button" id="load-more">Load more</button>
+        </div>
+        {% endif %}
         <div class="feedback-section">
             <h3 style="margin-top: 40px;">Optional feedback:</h3>
             <textarea name="feedback" rows="4" cols="60" placeholder="Leave your comments here..." style="padding: 10px; border-radius: 8px; border: 1px solid #ccc;"></textarea>
@@ -140,68 +209,296 @@ html = '''
             <button type="submit" name="action" value="none">None of these above</button>
         </div>
     </form>
+
+    <template id="card-template">
+        <div class="card">
+            <img alt="Image" width="200" height="200" loading="lazy" decoding="async">
+            <div class="name"></div>
+            <div class="price"></div>
+            <div class="env-score">
+                <span class="co2-icon">💨</span>
+                <span class="co2-text"></span>
+            </div>
+            <input type="checkbox" name="selected"> Select
+        </div>
+    </template>
+
+    <script>
+        // Further pages come from the JSON endpoint, appended as the shopper scrolls
+        // (or clicks "Load more"), so selections on every page stay in one form
+        const more = document.getElementById("more");
+        if (more) {
+            const cardsUrl = "/gallery/{{ session_id }}/cards?page=";
+            const container = document.getElementById("cards");
+            const template = document.getElementById("card-template");
+            let loading = false;
+
+            function renderCard(card) {
+                const node = template.content.firstElementChild.cloneNode(true);
+                const image = node.querySelector("img");
+                if (card.image_url) {
+                    image.src = card.image_url;
+                } else {
+                    const placeholder = document.createElement("div");
+                    placeholder.className = "no-image";
+                    placeholder.textContent = "No image";
+                    image.replaceWith(placeholder);
+                }
+                node.querySelector(".name").textContent = card.name;
+                node.querySelector(".price").textContent = card.price + " €";
+                node.querySelector(".co2-text").textContent = card.env_score + " CO₂";
+                node.querySelector("input").value = card.index;
+                if (card.alternatives.length) {
+                    const alternatives = document.createElement("div");
+                    alternatives.className = "alternatives";
+                    alternatives.textContent = "Also at:";
+                    for (const alternative of card.alternatives) {
+                        const link = document.createElement("a");
+                        link.href = alternative.url;
+                        link.target = "_blank";
+                        link.textContent = alternative.retailer + " – " + alternative.price + " €";
+                        alternatives.appendChild(link);
+                    }
+                    node.insertBefore(alternatives, node.querySelector("input"));
+                }
+                return node;
+            }
+
+            async function loadMore() {
+                const page = more.dataset.nextPage;
+                if (loading || !page) return;
+                loading = true;
+                try {
+                    const response = await fetch(cardsUrl + page);
+                    const data = await response.json();
+                    for (const card of data.cards) container.appendChild(renderCard(card));
+                    if (data.next_page) {
+                        more.dataset.nextPage = data.next_page;
+                    } else {
+                        observer.disconnect();
+                        more.remove();
+                    }
+                } finally {
+                    loading = false;
+                }
+            }
+
+            const observer = new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) loadMore();
+            }, {rootMargin: "400px"});
+            observer.observe(more);
+            document.getElementById("load-more").addEventListener("click", loadMore);
+        }
+    </script>
 </body>
 </html>
 '''
 
 
-@app.route("/", methods=["GET"])
-def display_gallery():
-    global items
-    return render_template_string(html, items=items)
+class GallerySession:
+    """One shopper's gallery: the cards shown and, once submitted, their selection and feedback."""
 
+    def __init__(self, items, partial=False):
+        # Unguessable, so a shopper cannot open another shopper's gallery
+        self.id = uuid.uuid4().hex
+        self.items = items
+        self.partial = partial
+        self.selected = None
+        self.feedback = None
+        self.created_at = time.monotonic()
+        self.done = threading.Event()
 
-@app.route("/submit", methods=["POST"])
-def submit_selection():
-    global selected_result, feedback_result, server
-    print("Form data:", request.form)
-    action = request.form.get("action")
+    def submit(self, selected, feedback):
+        self.selected = selected
+        self.feedback = feedback
+        self.done.set()
 
-    feedback_result = request.form.get("feedback", "")  # store feedback even if empty
-
-    if action == "ok":
-        selected = request.form.getlist("selected")
-        selected_result = selected
-    elif action == "none":
-        selected_result = []
-
-    threading.Thread(target=shutdown_server_delayed).start()
-    return selected_result
 
+class GalleryServer:
+    """One threaded HTTP server for every gallery of the process.
 
+    Each selection gets its own session (id, route and result slot), so
+    concurrent shoppers and pipeline runs do not overwrite each other.
+    """
 
-def shutdown_server_delayed():
-    global server
-    time.sleep(1)  # Give time for the response to be sent
-    if server:
-        server.shutdown()
+    def __init__(self, host=GALLERY_HOST, port=GALLERY_PORT):
+        self.host = host
+        self.port = port
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        """Serve in a background thread, once."""
+        with self._lock:
+            if self._server is not None:
+                return
+            self._server = make_server(self.host, self.port, app, threaded=True)
+        threading.Thread(target=self._server.serve_forever, name="gallery", daemon=True).start()
+        print(f"Gallery server running on http://{self.host}:{self.port}")
+
+    def url(self, session):
+        return f"http://{self.host}:{self.port}/gallery/{session.id}"
+
+    def open(self, items, partial=False):
+        """Register a new gallery and return its session."""
+        session = GallerySession(items, partial)
+        now = time.monotonic()
+        with self._lock:
+            for session_id, old in list(self.sessions.items()):
+                if now - old.created_at > GALLERY_SESSION_TTL:
+                    del self.sessions[session_id]
+                    # Unblock whoever still waits on it, with an empty selection
+                    old.submit([], "")
+            self.sessions[session.id] = session
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            return self.sessions.get(session_id)
+
+    def close(self, session):
+        with self._lock:
+            self.sessions.pop(session.id, None)
+
+    def shutdown(self):
+        with self._lock:
+            server, self._server = self._server, None
+        if server is not None:
+            server.shutdown()
+
+
+_gallery_server = None
+_gallery_lock = threading.Lock()
+
+
+def get_gallery_server():
+    """The process-wide gallery server, started on first use."""
+    global _gallery_server
+    with _gallery_lock:
+        if _gallery_server is None:
+            _gallery_server = GalleryServer()
+    _gallery_server.start()
+    return _gallery_server
+
+
+def _session_or_404(session_id):
+    session = get_gallery_server().get(session_id)
+    if session is None:
+        abort(404)
+    return session
+
+
+_gallery_template = None
+
+
+def gallery_template():
+    """The gallery page, compiled once instead of on every request."""
+    global _gallery_template
+    if _gallery_template is None:
+        _gallery_template = app.jinja_env.from_string(html)
+    return _gallery_template
+
+
+def image_src(image_url):
+    """The image URL if there is a usable one, else None (extraction may give None or a non-URL answer)."""
+    image_url = str(image_url or "").strip()
+    return image_url if image_url.startswith(("http://", "https://")) else None
+
+
+def card_of(index, item):
+    """JSON-ready card of a gallery item (image URL, price, name, env score, alternatives)."""
+    image_url, price, name, env_score, alternatives = item
+    return {
+        "index": index,
+        "image_url": image_src(image_url),
+        "price": price,
+        "name": name,
+        "env_score": env_score,
+        "alternatives": [
+            {"price": alt_price, "url": alt_url, "retailer": retailer}
+            for alt_price, alt_url, retailer in alternatives
+        ],
+    }
+
+
+def gallery_page(session, page):
+    """Cards of a 1-based page of the session, and the next page number (None after the last)."""
+    start = (page - 1) * GALLERY_PAGE_SIZE
+    end = start + GALLERY_PAGE_SIZE
+    cards = [card_of(index, session.items[index]) for index in range(start, min(end, len(session.items)))]
+    return cards, (page + 1 if end < len(session.items) else None)
+
+
+@app.route("/gallery/<session_id>", methods=["GET"])
+def display_gallery(session_id):
+    session = _session_or_404(session_id)
+    page = max(request.args.get("page", 1, type=int), 1)
+    cards, next_page = gallery_page(session, page)
+    return gallery_template().render(
+        cards=cards,
+        next_page=next_page,
+        total=len(session.items),
+        partial=session.partial,
+        session_id=session.id,
+    )
+
+
+@app.route("/gallery/<session_id>/cards", methods=["GET"])
+def gallery_cards(session_id):
+    """A further page of cards as JSON, for infinite scroll."""
+    session = _session_or_404(session_id)
+    page = max(request.args.get("page", 1, type=int), 1)
+    cards, next_page = gallery_page(session, page)
+    return jsonify(cards=cards, next_page=next_page, total=len(session.items))
+
+
+@app.route("/gallery/<session_id>/submit", methods=["POST"])
+def submit_selection(session_id):
+    session = _session_or_404(session_id)
+    print(f"Form data ({session.id}):", request.form)
+    action = request.form.get("action")
 
+    feedback = request.form.get("feedback", "")  # store feedback even if empty
 
-def run_app(images_with_prices, port=5000):
-    global items, server
-    items = images_with_prices
-    server = make_server('127.0.0.1', port, app)
-    print(f"Server running on http://127.0.0.1:{port}")
-    server.serve_forever()
+    if action == "ok":
+        try:
+            selected = sorted({int(idx) for idx in request.form.getlist("selected")})
+        except ValueError:
+            abort(400)
+        if any(not 0 <= idx < len(session.items) for idx in selected):
+            abort(400)
+    elif action == "none":
+        selected = []
+    else:
+        abort(400)
 
+    session.submit(selected, feedback)
+    return selected
 
-def get_user_selection(images_with_prices, port=5000):
-    global selected_result, feedback_result
-    selected_result = None
-    feedback_result = None
 
-    thread = threading.Thread(target=run_app, args=(images_with_prices, port))
-    thread.daemon = True
-    thread.start()
+def get_user_selection(images_with_prices, partial_results=False, open_browser=True):
+    """Show the cards in a new gallery session and block until the shopper submits it.
 
-    time.sleep(1)
-    import webbrowser
-    webbrowser.open(f'http://127.0.0.1:{port}')
+    Returns the selected card indices and the feedback; nothing is selected
+    if the gallery is left unanswered for GALLERY_SESSION_TTL seconds.
+    """
+    gallery = get_gallery_server()
+    session = gallery.open(images_with_prices, partial_results)
+    url = gallery.url(session)
+    print(f"Gallery for this selection: {url}")
+    if open_browser:
+        import webbrowser
+        webbrowser.open(url)
 
-    while selected_result is None:
-        time.sleep(0.1)
+    try:
+        if not session.done.wait(GALLERY_SESSION_TTL):
+            print(f"Gallery {session.id} expired without an answer")
+            return [], ""
+    finally:
+        gallery.close(session)
 
-    return [int(idx) for idx in selected_result], feedback_result
+    return [int(idx) for idx in session.selected], session.feedback
 
 
 @tool
@@ -220,16 +517,47 @@ def confirm_with_user(urls: list[str], prices: list[float], names:list[str], env
     
     """
 
-    images = [(url, price, name, env_score) for url, price, name, env_score in zip(extrate_images(urls), prices, names, environment_score)]
+    return select_products(urls, prices, names, environment_score, extrate_images(urls))
+
 
-    result, feedback_result= get_user_selection(images)
+def select_products(urls, prices, names, environment_score, image_urls, partial=False):
+    """Gallery selection for products whose image URLs are already known.
+
+    `partial` tells the user the products are the best found before the request deadline.
+    Returns the selected product URLs and the user's feedback.
+    """
+    # The same photo sold by several retailers becomes one card (cheapest offer)
+    # listing the other offers, instead of one card per retailer
+    # (compared on small thumbnails, each distinct photo downloaded once; missing ones stay alone)
+    sources = [image_src(image_url) for image_url in image_urls]
+    downloaded = {
+        result.url: result.image
+        for result in download_images(
+            list(dict.fromkeys(src for src in sources if src)),
+            timeout=DEDUP_DOWNLOAD_TIMEOUT,
+            max_size=DEDUP_THUMBNAIL_SIZE,
+        )
+    }
+    thumbnails = [downloaded.get(src) if src else None for src in sources]
+    groups = group_offers(thumbnails, prices)
+
+    images = []
+    for group in groups:
+        best = group[0]
+        alternatives = [(prices[i], urls[i], retailer_of(urls[i])) for i in group[1:]]
+        images.append((image_urls[best], prices[best], names[best], environment_score[best], alternatives))
+    if len(groups) < len(urls):
+        print(f"Collapsed {len(urls) - len(groups)} duplicate product images into alternative offers")
+
+    result, feedback_result= get_user_selection(images, partial_results=partial)
     url_results = []
     for idx in result:
-        url_results.append(urls[idx])
+        url_results.append(urls[groups[idx][0]])
 
     if url_results == []:
+        # Still a (urls, feedback) pair: the feedback drives the next refinement round
         print("User selected no products.")
-        return ["No products selected"]
+        return [], feedback_result
 
     print("User selected:", url_results)
     if feedback_result:
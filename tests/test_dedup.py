@@ -0,0 +1,38 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from dedup import NearDuplicateIndex, dedupe_products  # noqa: E402
+
+
+def test_different_model_numbers_are_kept():
+    products = [
+        {"brand": "Nike", "name": "Air Max 90"},
+        {"brand": "Nike", "name": "Air Max 95"},
+    ]
+    assert len(dedupe_products(products)) == 2
+
+    index = NearDuplicateIndex()
+    index.add(products[0])
+    assert index.find(products[1]) is None
+
+
+def test_same_model_is_merged():
+    products = [
+        {"brand": "Nike", "name": "Air Max 90"},
+        {"brand": "Nike", "name": "Nike Air-Max 90"},
+    ]
+    assert len(dedupe_products(products)) == 1
+
+    index = NearDuplicateIndex()
+    index.add(products[0])
+    assert index.find(products[1]) is products[0]
+
+
+def test_unscored_duplicate_loses_to_scored_one():
+    products = [
+        {"brand": "Nike", "name": "Air Max 90", "matching_score": None},
+        {"brand": "Nike", "name": "Nike Air-Max 90", "matching_score": 70},
+    ]
+    assert dedupe_products(products) == [products[1]]